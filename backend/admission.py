@@ -0,0 +1,247 @@
+"""
+Admission control and graceful degradation for inference endpoints.
+
+Each inference endpoint gets a concurrency limit; callers beyond it wait in a
+bounded queue shared by all endpoints. When the queue is full the request is
+shed immediately with 429, and when a queued request can't get a slot within
+the queue timeout it is shed with 503. Both carry Retry-After.
+
+End-to-end latency (queue wait + inference) is tracked over a sliding window.
+When p95 breaches the SLO the controller steps down one analysis level, and
+it steps back up once p95 falls comfortably below the SLO again:
+
+    0  full      configured mode, with aspects
+    1  binary    binary models only, with aspects
+    2  minimal   binary models only, no aspect model
+    3  cache     only answer from the result cache, shed on a miss
+
+Only requests that actually ran a model count toward p95: cache hits and
+requests shed at the cache-only level would otherwise pull p95 down and
+step the level back regardless of model load. Since the cache-only level
+runs no inference, it is left by probing: after a backoff (doubling each time
+the probe lands straight back at cache-only, capped at MAX_PROBE_BACKOFF)
+one request drops to ``minimal`` and its latency decides from there.
+
+Full-quality results are kept in an LRU cache keyed by review text and are
+served at any level. Anything below level 0 is flagged ``degraded`` so it can
+be re-scored later.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+LEVELS = (
+    {'name': 'full', 'mode': None, 'include_aspects': True},
+    {'name': 'binary', 'mode': 'binary', 'include_aspects': True},
+    {'name': 'minimal', 'mode': 'binary', 'include_aspects': False},
+    {'name': 'cache', 'mode': None, 'include_aspects': True},
+)
+CACHE_ONLY_LEVEL = 3
+MAX_PROBE_BACKOFF = 60.0
+
+
+class Overloaded(Exception):
+    def __init__(self, status: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+class AdmissionController:
+    def __init__(self, limits=None, max_queue=None, queue_timeout=None, slo_ms=None,
+                 max_level=None, window=200, evaluate_every=5.0, cache_size=None):
+        self.limits = limits or {
+            'analyze': _env_int('ADMISSION_LIMIT_ANALYZE', 2),
+            'reviews': _env_int('ADMISSION_LIMIT_REVIEWS', 2),
+        }
+        self.max_queue = max_queue if max_queue is not None else _env_int('ADMISSION_MAX_QUEUE', 16)
+        self.queue_timeout = queue_timeout if queue_timeout is not None else float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 10))
+        self.slo = (slo_ms if slo_ms is not None else _env_int('ADMISSION_SLO_MS', 3000)) / 1000.0
+        self.max_level = min(CACHE_ONLY_LEVEL, max_level if max_level is not None else _env_int('ADMISSION_MAX_LEVEL', CACHE_ONLY_LEVEL))
+        self.evaluate_every = evaluate_every
+
+        self._lock = threading.Lock()
+        self._slots = {name: threading.BoundedSemaphore(limit) for name, limit in self.limits.items()}
+        self._inflight = {name: 0 for name in self.limits}
+        self._waiting = 0
+        self._latencies = deque(maxlen=window)
+        self._last_evaluated = time.monotonic()
+        self.level = 0
+        self.shed_count = 0
+        self._local = threading.local()
+        self._cache_only_since = None
+        self._probing = False
+        self._failed_probes = 0
+
+        self._cache = OrderedDict()
+        self._cache_size = cache_size if cache_size is not None else _env_int('ADMISSION_CACHE_SIZE', 2048)
+        self._cache_lock = threading.Lock()
+
+    # -- admission -----------------------------------------------------------
+
+    def _retry_after(self, endpoint):
+        """Rough seconds until a slot frees: queued work divided by throughput."""
+        with self._lock:
+            recent = sorted(self._latencies)
+            waiting = self._waiting
+        typical = recent[len(recent) // 2] if recent else self.slo
+        per_slot = max(1, self.limits.get(endpoint, 1))
+        return max(1, math.ceil(typical * (waiting + 1) / per_slot))
+
+    @contextmanager
+    def admit(self, endpoint: str):
+        """Hold one inference slot for ``endpoint`` or raise Overloaded."""
+        started = time.monotonic()
+        slots = self._slots[endpoint]
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.max_queue:
+                    self.shed_count += 1
+                    full = True
+                else:
+                    self._waiting += 1
+                    full = False
+            if full:
+                raise Overloaded(429, 'inference queue is full', self._retry_after(endpoint))
+            try:
+                acquired = slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self.shed_count += 1
+                raise Overloaded(503, 'timed out waiting for an inference slot', self._retry_after(endpoint))
+
+        with self._lock:
+            self._inflight[endpoint] += 1
+        self._local.ran_inference = False
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._inflight[endpoint] -= 1
+            slots.release()
+            if self._local.ran_inference:
+                self._record(time.monotonic() - started)
+
+    def _record(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+            now = time.monotonic()
+            if now - self._last_evaluated < self.evaluate_every or len(self._latencies) < 5:
+                return
+            recent = sorted(self._latencies)
+            p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))]
+            if p95 > self.slo and self.level < self.max_level:
+                self.level += 1
+                if self.level == CACHE_ONLY_LEVEL:
+                    self._cache_only_since = now
+                    if self._probing:
+                        self._failed_probes += 1
+                    self._probing = False
+            elif p95 < self.slo * 0.5 and self.level > 0 and self._waiting == 0:
+                self.level -= 1
+                if self.level < CACHE_ONLY_LEVEL - 1:
+                    # The probe held up: the model really has headroom again
+                    self._probing = False
+                    self._failed_probes = 0
+            else:
+                self._last_evaluated = now
+                return
+            # Level changed: judge the new level on its own latencies
+            self._latencies.clear()
+            self._last_evaluated = now
+
+    def _probe(self) -> bool:
+        """At the cache-only level, let this request run at 'minimal' once the backoff has passed."""
+        with self._lock:
+            if self.level != CACHE_ONLY_LEVEL or self._waiting:
+                return False
+            backoff = min(MAX_PROBE_BACKOFF, self.evaluate_every * 2 ** self._failed_probes)
+            now = time.monotonic()
+            if self._cache_only_since is None or now - self._cache_only_since < backoff:
+                return False
+            self.level = CACHE_ONLY_LEVEL - 1
+            self._probing = True
+            self._latencies.clear()
+            self._last_evaluated = now
+            return True
+
+    def idle(self) -> bool:
+        with self._lock:
+            return self.level == 0 and self._waiting == 0 and not any(self._inflight.values())
+
+    def status(self) -> dict:
+        with self._lock:
+            recent = sorted(self._latencies)
+            return {
+                'level': self.level,
+                'level_name': LEVELS[self.level]['name'],
+                'waiting': self._waiting,
+                'inflight': dict(self._inflight),
+                'limits': dict(self.limits),
+                'max_queue': self.max_queue,
+                'slo_ms': int(self.slo * 1000),
+                'p50_ms': int(recent[len(recent) // 2] * 1000) if recent else None,
+                'p95_ms': int(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000) if recent else None,
+                'shed': self.shed_count,
+            }
+
+    # -- degraded analysis -----------------------------------------------------
+
+    @staticmethod
+    def _cache_key(text):
+        return hashlib.sha1((text or '').encode('utf-8')).hexdigest()
+
+    def _cache_get(self, key):
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+            return result
+
+    def _cache_put(self, key, result):
+        with self._cache_lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def analyze(self, text: str, analyze_fn, endpoint: str):
+        """
+        Run ``analyze_fn(text, mode=..., include_aspects=...)`` at the current
+        level. Must be called inside ``admit``. Returns a new dict; degraded
+        results carry ``degraded: True`` and ``analysis_level``.
+        """
+        key = self._cache_key(text)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return dict(cached)
+
+        level = self.level
+        if level == CACHE_ONLY_LEVEL and self._probe():
+            level = self.level
+        if level == CACHE_ONLY_LEVEL:
+            with self._lock:
+                self.shed_count += 1
+            raise Overloaded(503, 'overloaded; only cached analyses are being served', self._retry_after(endpoint))
+
+        options = LEVELS[level]
+        self._local.ran_inference = True
+        result = dict(analyze_fn(text, mode=options['mode'], include_aspects=options['include_aspects']))
+        if level == 0:
+            self._cache_put(key, result)
+            return dict(result)
+        result['degraded'] = True
+        result['analysis_level'] = options['name']
+        return result
@@ -1,63 +1,496 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 import json
 from datetime import datetime
-from nlp_analyzer import analyze_review, set_analysis_mode
+from nlp_analyzer import analyze_review, analyze_reviews, set_analysis_mode
+from change_feed import ChangeFeed
+from review_store import REVIEWS_FILE, load_reviews, save_reviews, reviews_write_lock, try_process_lock
+from trends import TrendRollups, GRANULARITIES
+from review_table import ReviewTable
+from admission import AdmissionController, Overloaded
+from hospital_registry import HospitalRegistry, SUGGEST_LIMIT
+from export_reviews import ndjson_chunks
+from aspect_clauses import clause_cache
+import profiling
 import os
+import threading
+import time
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Review-Seq'])
 
-REVIEWS_FILE = 'reviews.json'
 ANALYSIS_MODE = set_analysis_mode(os.environ.get('ANALYSIS_MODE', 'combined'))
+SSE_KEEPALIVE_SECONDS = 15
+# Each open stream holds a server thread; past this many per process, clients
+# are served the pending changes and told to reconnect (i.e. they poll)
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', max(1, int(os.environ.get('WEB_THREADS', 8)) // 2)))
+SSE_POLL_RETRY_MS = 10000
+RESCORE_INTERVAL_SECONDS = int(os.environ.get('RESCORE_INTERVAL_SECONDS', 30))
+RESCORE_BATCH_SIZE = 10
+# Reviews re-analyzed together; the aspect model batches clauses across each chunk
+REANALYZE_CHUNK_SIZE = 64
 
-def load_reviews():
-    if os.path.exists(REVIEWS_FILE):
-        with open(REVIEWS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
+change_feed = ChangeFeed()
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+trend_rollups = TrendRollups()
+admission = AdmissionController()
+hospital_registry = HospitalRegistry()
 
-def save_reviews(reviews):
-    with open(REVIEWS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(reviews, f, indent=2, ensure_ascii=False)
+_table_lock = threading.Lock()
+_table_state = {'table': None, 'stamp': None}
+
+def _file_stamp():
+    try:
+        st = os.stat(REVIEWS_FILE)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def review_table():
+    """Columnar view of reviews.json, rebuilt only when the file changes on disk."""
+    stamp = _file_stamp()
+    with _table_lock:
+        if _table_state['table'] is None or _table_state['stamp'] != stamp:
+            _table_state['table'] = ReviewTable.from_records(load_reviews())
+            _table_state['stamp'] = stamp
+        return _table_state['table']
+
+def _table_after_write(stamp_before, changed_reviews):
+    """Apply our own write to the cached table instead of reparsing the file."""
+    with _table_lock:
+        if _table_state['table'] is None or _table_state['stamp'] != stamp_before:
+            return
+        for review in changed_reviews:
+            _table_state['table'].upsert(review)
+        _table_state['stamp'] = _file_stamp()
+
+def hospitals():
+    """The hospital directory, reloaded if another process changed it; seeded from reviews on first use."""
+    hospital_registry.load(seed_reviews=load_reviews)
+    table = review_table()
+    hospital_registry.sync_counts(_table_state['stamp'], table.hospital_review_counts)
+    return hospital_registry
+
+def _canonical_hospital_id(hospital_id):
+    """Alias ids of merged hospitals query the hospital they were merged into (see migrate_hospital_ids.py)."""
+    if hospital_id is None:
+        return None
+    return hospitals().canonical_id(hospital_id) or hospital_id
+
+def _changed_reviews(changed_ids):
+    return review_table().records_by_id(changed_ids)
+
+def _table_filters(args):
+    return {
+        'hospital_id': _canonical_hospital_id(args.get('hospital_id')),
+        'hospital_name': args.get('hospital'),
+        'name_query': args.get('q'),
+        'sentiment': args.get('sentiment'),
+        'start': args.get('start'),
+        'end': args.get('end'),
+        'aspect': args.get('aspect'),
+        'aspect_sentiment': args.get('aspect_sentiment'),
+    }
+
+def _sync_trends():
+    """Bring the trend rollups up to the change-feed head (covers writes from other processes)."""
+    seq = change_feed.latest_seq()
+    if trend_rollups.seq == seq:
+        return
+    if trend_rollups.seq is None:
+        trend_rollups.rebuild(load_reviews(), seq)
+        return
+    latest, reset, changed_ids = change_feed.changes_since(trend_rollups.seq)
+    if reset:
+        trend_rollups.rebuild(load_reviews(), latest)
+        return
+    for review in _changed_reviews(changed_ids):
+        trend_rollups.apply(review)
+    trend_rollups.seq = latest
 
 @app.route('/api/reviews', methods=['GET'])
 def get_reviews():
-    reviews = load_reviews()
-    return jsonify(reviews)
+    # Read the cursor before the data: anything written in between is
+    # delivered again by the change feed, which is harmless for upserts.
+    seq = change_feed.latest_seq()
+    table = review_table()
+    filters = _table_filters(request.args)
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', None, type=int)
+    if offset < 0 or (limit is not None and limit < 0):
+        return jsonify({'error': 'limit and offset must be non-negative integers'}), 400
+    if any(value is not None for value in filters.values()) or offset or limit is not None:
+        # Filtered / paged listings come back newest first
+        rows = table.filter(**filters)
+        rows = rows[offset:offset + limit] if limit is not None else rows[offset:]
+        reviews = table.records(rows)
+    else:
+        reviews = table.records()
+    response = jsonify(reviews)
+    response.headers['X-Review-Seq'] = str(seq)
+    return response
 
-@app.route('/api/reviews', methods=['POST'])
-def create_review():
-    data = request.json
-    reviews = load_reviews()
-    
-    new_id = max([r['id'] for r in reviews], default=0) + 1
-    analysis = analyze_review(data['review_text'])
-    
-    new_review = {
-        'id': new_id,
-        'hospital_id': data.get('hospital_id', f'H{new_id:03d}'),
-        'hospital_name': data['hospital_name'],
-        'hospital_address': data.get('hospital_address', ''),
-        'review_text': data['review_text'],
-        'timestamp': datetime.utcnow().isoformat() + 'Z',
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    table = review_table()
+    rows = table.filter(**_table_filters(request.args))
+    return jsonify({'total': int(len(rows)), **table.sentiment_counts(rows)})
+
+@app.route('/api/hospitals/stats', methods=['GET'])
+def get_hospital_stats():
+    table = review_table()
+    rows = table.filter(**_table_filters(request.args))
+    return jsonify(table.hospital_stats(rows))
+
+@app.route('/api/export', methods=['GET'])
+def export_reviews():
+    """Stream matching reviews as NDJSON, oldest first, a chunk at a time."""
+    table = review_table()
+    rows = table.filter(**_table_filters(request.args))[::-1]
+    fields = [field for field in request.args.get('fields', '').split(',') if field] or None
+    flatten = request.args.get('flatten', '').lower() in {'1', 'true', 'yes'}
+    response = Response(
+        stream_with_context(ndjson_chunks(table, rows, fields=fields, flatten=flatten)),
+        mimetype='application/x-ndjson',
+    )
+    response.headers['Content-Disposition'] = 'attachment; filename=reviews.ndjson'
+    response.headers['X-Review-Count'] = str(len(rows))
+    return response
+
+@app.route('/api/reviews/changes', methods=['GET'])
+def get_review_changes():
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', None, type=int)
+    if limit is not None and limit < 1:
+        return jsonify({'error': 'limit must be a positive integer'}), 400
+    seq, reset, changed_ids = change_feed.changes_since(since, limit=limit)
+    return jsonify({
+        'seq': seq,
+        'reset': reset,
+        'reviews': [] if reset else _changed_reviews(changed_ids),
+    })
+
+@app.route('/api/reviews/stream', methods=['GET'])
+def stream_review_changes():
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id is not None and last_event_id.isdigit():
+        since = int(last_event_id)
+    else:
+        since = request.args.get('since', change_feed.latest_seq(), type=int)
+
+    def events(cursor):
+        seq, reset, changed_ids = change_feed.changes_since(cursor)
+        if reset:
+            return seq, f"id: {seq}\nevent: reset\ndata: {json.dumps({'seq': seq})}\n\n"
+        payload = {'seq': seq, 'reviews': _changed_reviews(changed_ids)}
+        return seq, f"id: {seq}\nevent: changes\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def generate(cursor):
+        # Taken inside the generator so the slot is only held while streaming
+        if not _sse_slots.acquire(blocking=False):
+            # No stream slot free: send what's pending and let EventSource reconnect later
+            yield f'retry: {SSE_POLL_RETRY_MS}\n\n'
+            if change_feed.latest_seq() != cursor:
+                yield events(cursor)[1]
+            return
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                latest = change_feed.wait_for_changes(cursor, timeout=SSE_KEEPALIVE_SECONDS)
+                if latest == cursor:
+                    yield ': keep-alive\n\n'
+                    continue
+                cursor, event = events(cursor)
+                yield event
+        finally:
+            _sse_slots.release()
+
+    response = Response(stream_with_context(generate(since)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _overloaded_response(error):
+    response = jsonify({'error': error.reason, 'retry_after': error.retry_after})
+    response.status_code = error.status
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def _analysis_fields(analysis):
+    fields = {
         'overall_sentiment': analysis['sentiment'],
         'sentiment_score': analysis['score'],
         'star_rating': analysis.get('star_rating', None),
-        'aspects': analysis['aspects']
+        'aspects': analysis['aspects'],
     }
+    if analysis.get('degraded'):
+        fields['degraded'] = True
+    return fields
+
+def _apply_analysis_updates(updates):
+    """Write re-analysis results {review_id: fields} to reviews.json and publish them."""
+    with reviews_write_lock():
+        # Re-read under the lock so reviews created while the models were running are kept
+        reviews = load_reviews()
+        for review in reviews:
+            if review['id'] in updates:
+                review.pop('degraded', None)
+                review.update(updates[review['id']])
+        stamp_before = _file_stamp()
+        save_reviews(reviews)
+        _table_after_write(stamp_before, [r for r in reviews if r['id'] in updates])
+        changed_ids = list(updates)
+        seq = change_feed.append(changed_ids) if changed_ids else change_feed.latest_seq()
+    return reviews, seq
+
+def _rescore_degraded_batch():
+    """Re-run full analysis on a few reviews stored while the server was degraded."""
+    # One worker at a time: the others would pick the same ids and publish duplicates
+    with try_process_lock('rescore') as acquired:
+        if not acquired:
+            return 0
+        # Read after taking the lock so ids the previous holder fixed are gone
+        pending = review_table().degraded_ids()[:RESCORE_BATCH_SIZE]
+        updates = {}
+        for review in review_table().records_by_id(pending):
+            # Yield to live traffic as soon as it shows up
+            if not admission.idle():
+                break
+            updates[review['id']] = _analysis_fields(analyze_review(review['review_text']))
+        if updates:
+            _apply_analysis_updates(updates)
+        return len(updates)
+
+def _rescore_loop():
+    while True:
+        time.sleep(RESCORE_INTERVAL_SECONDS)
+        if not admission.idle():
+            continue
+        try:
+            _rescore_degraded_batch()
+        except Exception as e:
+            app.logger.warning('Re-scoring degraded reviews failed: %s', e)
+
+_rescorer_lock = threading.Lock()
+_rescorer_thread = None
+
+@app.before_request
+def _ensure_rescorer():
+    # Started on the first request rather than at import, so a preloading
+    # gunicorn master never forks with this thread already running.
+    global _rescorer_thread
+    if _rescorer_thread is not None:
+        return
+    with _rescorer_lock:
+        if _rescorer_thread is None:
+            _rescorer_thread = threading.Thread(target=_rescore_loop, name='rescore-degraded', daemon=True)
+            _rescorer_thread.start()
+
+# Open-ended streams would hold the single per-request profiler until the client leaves
+_UNPROFILED_ENDPOINTS = {'stream_review_changes'}
+
+@app.before_request
+def _start_request_profile():
+    if not profiling.enabled() or not profiling.check_token(request.headers.get('X-Profile')):
+        return
+    if request.endpoint in _UNPROFILED_ENDPOINTS:
+        g.request_profile = 'unsupported'
+        return
+    g.request_profile = profiling.start_request_profile(request.endpoint or request.path) or 'busy'
+
+@app.after_request
+def _tag_request_profile(response):
+    if profiling.enabled() and 'request_profile' in g:
+        profile = g.request_profile
+        response.headers['X-Profile-Id'] = profile if isinstance(profile, str) else profile.name
+    return response
+
+@app.teardown_request
+def _finish_request_profile(error=None):
+    # Runs after a streamed body is fully sent, so generators are included
+    if profiling.enabled() and g.get('request_profile') not in (None, 'busy', 'unsupported'):
+        g.request_profile.finish()
+
+@app.route('/api/reviews', methods=['POST'])
+def create_review():
+    data = request.json
+    # Run the models before taking the write lock so other workers aren't blocked on inference
+    try:
+        with admission.admit('reviews'):
+            analysis = admission.analyze(data['review_text'], analyze_review, 'reviews')
+    except Overloaded as e:
+        return _overloaded_response(e)
     
-    reviews.append(new_review)
-    save_reviews(reviews)
+    with reviews_write_lock():
+        reviews = load_reviews()
+        new_id = max([r['id'] for r in reviews], default=0) + 1
+        # Match to an existing hospital (by id, else normalized name/address) before minting an id
+        hospital = hospitals().resolve(
+            data['hospital_name'],
+            data.get('hospital_address', ''),
+            hospital_id=data.get('hospital_id'),
+        )
+        
+        new_review = {
+            'id': new_id,
+            'hospital_id': hospital['hospital_id'],
+            'hospital_name': hospital['name'],
+            'hospital_address': (data.get('hospital_address') or '').strip() or hospital['address'],
+            'review_text': data['review_text'],
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            **_analysis_fields(analysis),
+        }
+        
+        reviews.append(new_review)
+        stamp_before = _file_stamp()
+        save_reviews(reviews)
+        _table_after_write(stamp_before, [new_review])
+        hospital_registry.record_review(hospital['hospital_id'])
+        seq = change_feed.append([new_id])
+    if trend_rollups.seq == seq - 1:
+        trend_rollups.apply(new_review, seq=seq)
     
     return jsonify(new_review), 201
 
+@app.route('/api/health', methods=['GET'])
+def health():
+    return jsonify({
+        'status': 'ok',
+        'mode': ANALYSIS_MODE,
+        'pid': os.getpid(),
+        'admission': admission.status(),
+        'aspect_clause_cache': clause_cache.stats(),
+    })
+
 @app.route('/api/analyze', methods=['POST'])
 def analyze_text():
     data = request.json
-    analysis = analyze_review(data['text'])
+    try:
+        with admission.admit('analyze'):
+            analysis = admission.analyze(data['text'], analyze_review, 'analyze')
+    except Overloaded as e:
+        return _overloaded_response(e)
     return jsonify(analysis)
 
+@app.route('/api/reanalyze-all', methods=['POST'])
+def reanalyze_all():
+    reviews = load_reviews()
+    updates = {}
+
+    failed = 0        # reviews whose analysis raised; left as they were
+    aspects_kept = 0  # reviews whose aspect pass failed; their stored aspects stay
+
+    pending = [review for review in reviews if review.get('review_text')]
+    for start in range(0, len(pending), REANALYZE_CHUNK_SIZE):
+        chunk = pending[start:start + REANALYZE_CHUNK_SIZE]
+        try:
+            analyses = analyze_reviews([review['review_text'] for review in chunk])
+        except Exception as e:
+            app.logger.warning('Re-analysis of reviews %s-%s failed: %s', chunk[0]['id'], chunk[-1]['id'], e)
+            failed += len(chunk)
+            continue
+        for review, analysis in zip(chunk, analyses):
+            updated = _analysis_fields(analysis)
+            if updated['aspects'] is None:
+                del updated['aspects']
+                aspects_kept += 1
+            if review.get('degraded') or any(review.get(key) != value for key, value in updated.items()):
+                updates[review['id']] = updated
+
+    if pending and failed == len(pending):
+        return jsonify({'error': 'Re-analysis failed for every review', 'failed': failed}), 500
+
+    reviews, seq = _apply_analysis_updates(updates)
+    trend_rollups.rebuild(reviews, seq)
+
+    return jsonify({
+        'total': len(reviews),
+        'updated': len(updates),
+        'failed': failed,
+        'aspects_kept': aspects_kept,
+        'seq': seq,
+    })
+
+@app.route('/api/hospitals', methods=['GET'])
+def list_hospitals():
+    return jsonify(hospitals().all())
+
+@app.route('/api/hospitals/suggest', methods=['GET'])
+def suggest_hospitals():
+    prefix = request.args.get('prefix', '')
+    limit = request.args.get('limit', SUGGEST_LIMIT, type=int)
+    return jsonify(hospitals().suggest(prefix, limit=limit))
+
+@app.route('/api/hospitals/<hospital_id>', methods=['GET'])
+def get_hospital(hospital_id):
+    hospital = hospitals().get(hospital_id)
+    if hospital is None:
+        return jsonify({'error': f'Unknown hospital {hospital_id}'}), 404
+    return jsonify(hospital)
+
+@app.route('/api/hospitals/<hospital_id>/trends', methods=['GET'])
+def get_hospital_trends(hospital_id):
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+
+    hospital_id = _canonical_hospital_id(hospital_id)
+    _sync_trends()
+    if not trend_rollups.has_hospital(hospital_id):
+        return jsonify({'error': f'No reviews for hospital {hospital_id}'}), 404
+
+    try:
+        buckets = trend_rollups.query(
+            hospital_id,
+            granularity=granularity,
+            start=request.args.get('start') or None,
+            end=request.args.get('end') or None,
+            aspect=request.args.get('aspect'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'hospital_id': hospital_id, 'granularity': granularity, 'buckets': buckets})
+
+
+def _profiling_denied():
+    if not profiling.enabled():
+        return jsonify({'error': 'Profiling is disabled (set PROFILING_TOKEN)'}), 404
+    if not profiling.check_token(request.headers.get('X-Profile-Token')):
+        return jsonify({'error': 'Invalid profiling token'}), 403
+    return None
+
+@app.route('/api/admin/profile', methods=['GET'])
+def sample_profile():
+    denied = _profiling_denied()
+    if denied:
+        return denied
+    seconds = min(max(request.args.get('seconds', 10, type=float), 0.1), profiling.MAX_SAMPLE_SECONDS)
+    interval = max(request.args.get('interval_ms', profiling.DEFAULT_INTERVAL * 1000, type=float), 1) / 1000
+    try:
+        counts, ticks = profiling.sample(seconds, interval)
+    except profiling.ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    response = Response(profiling.format_folded(counts), mimetype='text/plain')
+    response.headers['X-Profile-Pid'] = str(os.getpid())
+    response.headers['X-Profile-Samples'] = str(ticks)
+    return response
+
+@app.route('/api/admin/profiles/<name>', methods=['GET'])
+def get_request_profile(name):
+    denied = _profiling_denied()
+    if denied:
+        return denied
+    path = profiling.profile_path(name)
+    if path is None:
+        return jsonify({'error': f'Unknown profile {name}'}), 404
+    if request.args.get('format') == 'raw':
+        with open(path, 'rb') as f:
+            return Response(f.read(), mimetype='application/octet-stream',
+                            headers={'Content-Disposition': f'attachment; filename={name}'})
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in {'cumulative', 'tottime', 'ncalls'}:
+        return jsonify({'error': 'sort must be one of cumulative, tottime, ncalls'}), 400
+    return Response(profiling.profile_summary(path, sort=sort), mimetype='text/plain')
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,196 @@
+"""
+Clause-level aspect analysis.
+
+Feeding a whole review to the zero-shot model blends every opinion in it into
+one polarity per aspect ("staff is good but they can respond to calls
+faster" comes out as one Staff score), and costs review length x every
+hypothesis. Instead:
+  • reviews are split into clauses at sentence ends and contrast markers
+    (but, however, although, ...)
+  • each clause is routed only to the aspects whose keywords it mentions;
+    a review with no routed clause falls back to the whole text vs. every
+    aspect, as before
+  • the (clause, hypothesis) pairs of a whole review set are deduplicated and
+    scored together, so the model runs in a few padded batches
+  • entailment scores are memoized per normalized clause and hypothesis in
+    an LRU cache, since short clauses ("staff was rude") recur constantly;
+    the model itself always sees the clause as written
+  • per-clause findings are merged back into the usual top-4
+    [{'aspect', 'sentiment'}] list per review
+
+The model call itself is passed in as ``score_pairs(premises, hypotheses)``
+returning entailment probabilities, so this module has no model dependency.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+MAX_ASPECTS = 4
+MIN_CONFIDENCE = 0.3
+MIN_CLAUSE_WORDS = 3
+CLAUSE_CACHE_SIZE = int(os.environ.get('CLAUSE_CACHE_SIZE', 50000))
+
+# Canonical aspect -> keyword stems that make a clause worth asking about it
+ASPECT_KEYWORDS = {
+    'Staff': (
+        'staff', 'nurse', 'doctor', 'dr', 'physician', 'surgeon', 'consultant', 'receptionist', 'reception',
+        'attendant', 'ward boy', 'housekeeping', 'security', 'management', 'team', 'behav', 'rude', 'polite',
+        'friendly', 'caring', 'courteous', 'helpful', 'arrogant', 'attitude', 'professional',
+    ),
+    'Wait Time': (
+        'wait', 'queue', 'delay', 'hour', 'minute', 'late', 'slow', 'quick', 'fast', 'prompt', 'immediate',
+        'respond', 'response', 'appointment', 'took long', 'long time', 'on time',
+    ),
+    'Treatment': (
+        'treat', 'surgery', 'surgical', 'operat', 'procedure', 'diagnos', 'medicine', 'medication', 'therapy',
+        'care', 'cure', 'recover', 'heal', 'test', 'scan', 'report', 'icu', 'emergency', 'consultation',
+        'facilit', 'ot', 'equipment', 'clean', 'hygien',
+    ),
+    'Insurance': (
+        'insurance', 'insur', 'claim', 'cashless', 'tpa', 'mediclaim', 'policy', 'bill', 'charge', 'cost',
+        'expensive', 'price', 'payment', 'refund', 'money', 'fee', 'fees',
+    ),
+}
+
+_CONTRAST = r'but|however|although|though|whereas|yet|except|otherwise|unfortunately'
+# Words whose trailing '.' doesn't end a sentence ("Dr. Sharma")
+_ABBREVIATIONS = ('dr', 'mr', 'mrs', 'ms', 'prof', 'st', 'sr', 'jr', 'vs', 'no')
+# A '.' ends a sentence only before whitespace and a capital letter, or at the end
+# of the text, so "2.5 hours" and "Dr. Sharma" stay whole
+_SENTENCE_END = ''.join(rf'(?<!\b{word})' for word in _ABBREVIATIONS) + r'\.+(?=\s+(?-i:[A-Z])|\s*$)'
+_CLAUSE_SPLIT = re.compile(rf'[!?;\n]+|{_SENTENCE_END}|,?\s+\b(?:{_CONTRAST})\b,?\s*', flags=re.IGNORECASE)
+
+
+def _keyword_pattern(keywords):
+    # Keywords match word prefixes ('treat' -> 'treated'); short ones only whole words ('ot', not 'other')
+    parts = [re.escape(k) + (r'\b' if len(k) <= 3 else '') for k in keywords]
+    return re.compile(r'\b(?:' + '|'.join(parts) + ')', flags=re.IGNORECASE)
+
+
+_KEYWORD_PATTERNS = {aspect: _keyword_pattern(keywords) for aspect, keywords in ASPECT_KEYWORDS.items()}
+
+
+def normalize_clause(text: str) -> str:
+    """Casefold and collapse whitespace/punctuation: the memoization key, never the model input."""
+    text = re.sub(r"[^0-9a-z'\s]+", ' ', (text or '').casefold())
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def split_clauses(text: str):
+    """Clauses of a review as written; fragments under MIN_CLAUSE_WORDS join the previous clause."""
+    clauses = []
+    for piece in _CLAUSE_SPLIT.split(text or ''):
+        clause = ' '.join(piece.split())
+        words = normalize_clause(clause).split()
+        if not words:
+            continue
+        if clauses and len(words) < MIN_CLAUSE_WORDS:
+            clauses[-1] = f'{clauses[-1]} {clause}'
+        else:
+            clauses.append(clause)
+    return clauses
+
+
+def route_clause(clause: str):
+    """Aspects a clause plausibly talks about, by keyword."""
+    return [aspect for aspect, pattern in _KEYWORD_PATTERNS.items() if pattern.search(clause)]
+
+
+class ClauseCache:
+    """Thread-safe LRU of (normalized clause, hypothesis) -> entailment probability."""
+
+    def __init__(self, size: int = CLAUSE_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+clause_cache = ClauseCache()
+
+
+def _plan(text, aspect_hypotheses):
+    """[(cache key, clause text, [aspects])] for one review."""
+    routed = [(normalize_clause(clause), clause, route_clause(clause)) for clause in split_clauses(text)]
+    routed = [(key, clause, aspects) for key, clause, aspects in routed if aspects]
+    if routed:
+        return routed
+    whole = ' '.join((text or '').split())
+    key = normalize_clause(whole)
+    return [(key, whole, list(aspect_hypotheses))] if key else []
+
+
+def analyze_aspects(texts, aspect_hypotheses, score_pairs, cache: ClauseCache = None):
+    """
+    Top aspects for every text in ``texts``.
+
+    aspect_hypotheses: canonical aspect -> hypothesis labels for it (aliases
+    included); each label is asked as "<label> positive" and "<label> negative".
+    score_pairs(premises, hypotheses): entailment probability for each pair.
+    """
+    cache = cache if cache is not None else clause_cache
+    plans = [_plan(text, aspect_hypotheses) for text in texts]
+
+    # Every (clause, hypothesis) pair the whole set needs, minus cached ones.
+    # Pairs are keyed by the normalized clause; the model gets the clause as written.
+    scores = {}
+    pending = []  # (key, premise)
+    for plan in plans:
+        for clause_key, clause, aspects in plan:
+            for aspect in aspects:
+                for label in aspect_hypotheses[aspect]:
+                    for polarity in ('positive', 'negative'):
+                        key = (clause_key, f'{label} {polarity}')
+                        if key in scores:
+                            continue
+                        cached = cache.get(key)
+                        scores[key] = cached
+                        if cached is None:
+                            pending.append((key, clause))
+    if pending:
+        probabilities = score_pairs([premise for _, premise in pending], [key[1] for key, _ in pending])
+        for (key, _), probability in zip(pending, probabilities):
+            probability = float(probability)
+            scores[key] = probability
+            cache.put(key, probability)
+
+    results = []
+    for plan in plans:
+        merged = {}  # aspect -> (net signed strength, strongest clause strength)
+        for clause_key, _, aspects in plan:
+            for aspect in aspects:
+                positive = max(scores[(clause_key, f'{label} positive')] for label in aspect_hypotheses[aspect])
+                negative = max(scores[(clause_key, f'{label} negative')] for label in aspect_hypotheses[aspect])
+                if max(positive, negative) < MIN_CONFIDENCE:
+                    continue
+                net, strongest = merged.get(aspect, (0.0, 0.0))
+                merged[aspect] = (net + positive - negative, max(strongest, abs(positive - negative)))
+        findings = sorted(merged.items(), key=lambda item: item[1][1], reverse=True)
+        results.append([
+            {'aspect': aspect, 'sentiment': 'positive' if net >= 0 else 'negative'}
+            for aspect, (net, _) in findings[:MAX_ASPECTS]
+        ])
+    return results
@@ -0,0 +1,214 @@
+"""
+Serving benchmark: requests/sec and memory as the gunicorn worker count grows.
+
+For each worker count this starts `gunicorn -c gunicorn.conf.py app:app`,
+waits for /api/health, drives POST /api/analyze from concurrent clients
+using review texts from reviews.json, then samples memory of the master and
+all workers:
+  • RSS - resident pages per process, summed (double-counts shared weights)
+  • PSS - proportional set size, summed (shared pages split between sharers;
+          this is the real footprint and should grow slowly with workers)
+Admission control is pinned off in the spawned server (full-quality analysis
+only, no result cache, slots and queue >= concurrency) so every request runs
+the models; degraded or shed responses are still counted and reported.
+Usage: python benchmark_serving.py --workers 1 2 4 --duration 30 --concurrency 8
+Linux only (reads /proc).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def _children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def _memory_kb(pid):
+    """(rss_kb, pss_kb) for one process from smaps_rollup."""
+    rss = pss = 0
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Rss:'):
+                    rss = int(line.split()[1])
+                elif line.startswith('Pss:'):
+                    pss = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, pss
+
+
+def _tree_memory_mb(master_pid):
+    pids = [master_pid] + _children(master_pid)
+    totals = [_memory_kb(pid) for pid in pids]
+    return sum(r for r, _ in totals) / 1024, sum(p for _, p in totals) / 1024, len(pids) - 1
+
+
+def _wait_ready(base_url, proc, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f'{base_url}/api/health', timeout=2) as resp:
+                if resp.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(1)
+    raise TimeoutError("server did not become ready")
+
+
+def _drive_load(base_url, texts, duration, concurrency):
+    latencies = []
+    errors = [0]
+    shed = [0]      # 429/503 from admission control
+    degraded = [0]  # answered below full quality
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def client():
+        rng = random.Random()
+        while time.time() < stop_at:
+            body = json.dumps({'text': rng.choice(texts)}).encode('utf-8')
+            req = urllib.request.Request(
+                f'{base_url}/api/analyze', data=body, headers={'Content-Type': 'application/json'}
+            )
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=120) as resp:
+                    result = json.loads(resp.read())
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if result.get('degraded'):
+                        degraded[0] += 1
+                    else:
+                        latencies.append(elapsed)
+            except urllib.error.HTTPError as e:
+                with lock:
+                    if e.code in (429, 503):
+                        shed[0] += 1
+                    else:
+                        errors[0] += 1
+            except Exception:
+                with lock:
+                    errors[0] += 1
+
+    started = time.time()
+    pool = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    wall = time.time() - started
+    return latencies, errors[0], shed[0], degraded[0], wall
+
+
+def run_one(workers, args, texts):
+    port = args.base_port + workers
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, WEB_WORKERS=str(workers), BIND=f'127.0.0.1:{port}')
+    # Measure the models, not admission control: no degrading, no cached answers,
+    # and enough slots that no client waits in or is shed from the queue
+    env.update(
+        ADMISSION_MAX_LEVEL='0',
+        ADMISSION_CACHE_SIZE='0',
+        ADMISSION_LIMIT_ANALYZE=str(args.concurrency),
+        ADMISSION_MAX_QUEUE=str(args.concurrency),
+    )
+    if args.torch_threads:
+        env['TORCH_THREADS'] = str(args.torch_threads)
+    if args.parallel_stages:
+        env['ANALYZER_PARALLEL_STAGES'] = str(args.parallel_stages)
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        _wait_ready(base_url, proc, args.startup_timeout)
+        idle_rss, idle_pss, _ = _tree_memory_mb(proc.pid)
+        # Warm up every worker once so lazily-touched pages are counted
+        _drive_load(base_url, texts, min(5, args.duration), workers)
+        latencies, errors, shed, degraded, wall = _drive_load(base_url, texts, args.duration, args.concurrency)
+        rss, pss, n_workers = _tree_memory_mb(proc.pid)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    latencies.sort()
+    return {
+        'workers': n_workers,
+        'requests': len(latencies),
+        'errors': errors,
+        'shed': shed,
+        'degraded': degraded,
+        'rps': len(latencies) / wall if wall else 0.0,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if len(latencies) >= 20 else None,
+        'idle_rss_mb': idle_rss,
+        'idle_pss_mb': idle_pss,
+        'rss_mb': rss,
+        'pss_mb': pss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preforked serving across worker counts.")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--duration', type=int, default=30, help='Seconds of load per worker count')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent client threads')
+    parser.add_argument('--torch-threads', type=int, help='Override TORCH_THREADS per worker')
+    parser.add_argument('--parallel-stages', help="Override ANALYZER_PARALLEL_STAGES per worker ('auto' or an int)")
+    parser.add_argument('--base-port', type=int, default=5100)
+    parser.add_argument('--startup-timeout', type=int, default=600)
+    parser.add_argument('--reviews', default='reviews.json')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    with open(args.reviews, 'r', encoding='utf-8') as f:
+        texts = [r['review_text'] for r in json.load(f) if r.get('review_text')]
+    if not texts:
+        print("❌ Error: no review texts to send")
+        return
+
+    results = []
+    for workers in args.workers:
+        print(f"🔄 {workers} worker(s)...")
+        result = run_one(workers, args, texts)
+        results.append(result)
+        print(f"  ✓ {result['rps']:.2f} req/s, p50 {result['p50_ms'] or 0:.0f} ms, "
+              f"RSS {result['rss_mb']:.0f} MB, PSS {result['pss_mb']:.0f} MB, errors {result['errors']}")
+        if result['shed'] or result['degraded']:
+            print(f"  ⚠ {result['shed']} shed and {result['degraded']} degraded responses left out of req/s and latency")
+
+    print("\n" + "=" * 78)
+    print(f"{'workers':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>9} {'PSS MB':>9} {'PSS/worker':>11}")
+    for r in results:
+        p95 = f"{r['p95_ms']:.0f}" if r['p95_ms'] is not None else '-'
+        p50 = f"{r['p50_ms']:.0f}" if r['p50_ms'] is not None else '-'
+        per_worker = r['pss_mb'] / max(1, r['workers'])
+        print(f"{r['workers']:>7} {r['rps']:>8.2f} {p50:>8} {p95:>8} {r['rss_mb']:>9.0f} {r['pss_mb']:>9.0f} {per_worker:>11.0f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Append-only change log for the review store.
+
+Every write to reviews.json (new review, re-analysis) appends one line per
+touched review id with a monotonically increasing sequence number. The log
+lives next to reviews.json so the API server, the re-analysis script and
+several server processes all share the same sequence.
+
+Clients keep a cursor (the last seq they applied) and ask for everything
+after it; entries only carry ids, the current review body is joined in by
+the caller so a review changed several times is delivered once.
+
+The log is compacted once it holds 2 x CHANGE_FEED_RETAIN entries: the newest
+CHANGE_FEED_RETAIN are rewritten to a fresh file that replaces the old one.
+Cursors older than the oldest retained entry get ``reset`` and reload.
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+CHANGES_FILE = 'review_changes.log'
+RETAIN_ENTRIES = int(os.environ.get('CHANGE_FEED_RETAIN', 10000))
+
+
+class ChangeFeed:
+    def __init__(self, path: str = CHANGES_FILE, retain: int = RETAIN_ENTRIES):
+        self.path = path
+        self.retain = max(1, retain)
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._entries = []  # [(seq, review_id)] in seq order
+        self._offset = 0
+        self._inode = None
+
+    def _refresh(self):
+        """Read lines appended since the last refresh (by any process). Caller holds _lock."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._entries = []
+            self._offset = 0
+            self._inode = None
+            return
+        size = st.st_size
+        if st.st_ino != self._inode or size < self._offset:
+            # Log was compacted, truncated or replaced; start over.
+            self._entries = []
+            self._offset = 0
+            self._inode = st.st_ino
+        if size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        # Only consume complete lines; a concurrent writer may be mid-line.
+        end = chunk.rfind(b'\n') + 1
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                self._entries.append((int(entry['seq']), entry['id']))
+            except (ValueError, KeyError):
+                continue
+        self._offset += end
+
+    def latest_seq(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._entries[-1][0] if self._entries else 0
+
+    def _open_locked(self):
+        """Open the log for appending with an exclusive lock on the file currently at ``path``."""
+        while True:
+            f = open(self.path, 'a', encoding='utf-8')
+            if not fcntl:
+                return f
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            # Another process may have compacted (replaced) the log while we waited
+            if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                return f
+            f.close()
+
+    def _compact(self):
+        """Keep only the newest ``retain`` entries. Caller holds _lock and the file lock."""
+        kept = self._entries[-self.retain:]
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(''.join(json.dumps({'seq': seq, 'id': review_id}) + '\n' for seq, review_id in kept))
+        os.replace(tmp_path, self.path)
+
+    def append(self, review_ids) -> int:
+        """Record that the given reviews changed. Returns the new latest seq."""
+        review_ids = list(review_ids)
+        with self._cond:
+            f = self._open_locked()
+            try:
+                self._refresh()
+                seq = self._entries[-1][0] if self._entries else 0
+                ts = datetime.utcnow().isoformat() + 'Z'
+                lines = []
+                for review_id in review_ids:
+                    seq += 1
+                    lines.append(json.dumps({'seq': seq, 'id': review_id, 'ts': ts}) + '\n')
+                f.write(''.join(lines))
+                f.flush()
+                self._refresh()
+                if len(self._entries) >= 2 * self.retain:
+                    self._compact()
+            finally:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                f.close()
+            self._refresh()
+            self._cond.notify_all()
+            return self._entries[-1][0] if self._entries else 0
+
+    def changes_since(self, since: int, limit: int = None):
+        """
+        Return (latest_seq, reset, changed_ids) for entries with seq > since.
+
+        ``reset`` is True when the cursor cannot be served from the log (it is
+        ahead of the log, e.g. the log was deleted, or older than the oldest
+        entry compaction kept) and the client must refetch the full dataset. Ids are de-duplicated, keeping their last position.
+        When ``limit`` cuts the result short, latest_seq is the seq of the last
+        entry included so the client can page forward; ``limit <= 0`` returns
+        no entries and the cursor unchanged.
+        """
+        with self._lock:
+            self._refresh()
+            entries = self._entries
+            latest = entries[-1][0] if entries else 0
+            if since > latest or (entries and since < entries[0][0] - 1):
+                return latest, True, []
+            start = bisect.bisect_right(entries, since, key=lambda entry: entry[0])
+            window = entries[start:]
+            if limit is not None and limit <= 0:
+                return since, False, []
+            if limit is not None and len(window) > limit:
+                window = window[:limit]
+                latest = window[-1][0]
+
+        last_pos = {}
+        for pos, (_, review_id) in enumerate(window):
+            last_pos[review_id] = pos
+        changed_ids = sorted(last_pos, key=last_pos.get)
+        return latest, False, changed_ids
+
+    def wait_for_changes(self, since: int, timeout: float = 15.0, poll_interval: float = 1.0) -> int:
+        """
+        Block until the log advances past ``since`` or ``timeout`` elapses.
+
+        Writers in this process wake waiters immediately; writes from other
+        processes are picked up by polling the log size.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                self._refresh()
+                latest = self._entries[-1][0] if self._entries else 0
+                if latest != since:
+                    return latest
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return latest
+                self._cond.wait(min(poll_interval, remaining))
@@ -0,0 +1,167 @@
+"""
+Export reviews and their analyses for downstream analytics
+  • NDJSON: one review per line, produced in fixed-size chunks so the API
+    (GET /api/export) and this script never build the whole output in memory
+  • Parquet: a hive-partitioned dataset (hospital_id=<id>/month=<YYYY-MM>/)
+    with aspects flattened into one column per aspect, so readers can prune
+    both partitions and columns
+Usage:
+  python export_reviews.py --format parquet --output exports/reviews
+  python export_reviews.py --format ndjson --output reviews.ndjson [--hospital-id H007] [--start 2025-11-01]
+"""
+import argparse
+import json
+import os
+import re
+import numpy as np
+import sys
+from review_table import ReviewTable, SENTIMENTS, ASPECT_POLARITIES
+from hospital_registry import HospitalRegistry
+
+REVIEWS_FILE = 'reviews.json'
+CHUNK_SIZE = 500
+
+
+def aspect_column(label: str) -> str:
+    """'Wait Time' -> 'aspect_wait_time'"""
+    return 'aspect_' + re.sub(r'[^0-9a-z]+', '_', (label or '').lower()).strip('_')
+
+
+def flatten_aspects(record):
+    """Replace the aspects list with one aspect_<name> key per aspect present."""
+    flat = {key: value for key, value in record.items() if key != 'aspects'}
+    for item in record.get('aspects') or []:
+        flat[aspect_column(item.get('aspect'))] = item.get('sentiment')
+    return flat
+
+
+def ndjson_chunks(table, rows, fields=None, flatten=False, chunk_size=CHUNK_SIZE):
+    """Yield NDJSON text for ``rows`` of a ReviewTable, ``chunk_size`` reviews at a time."""
+    for start in range(0, len(rows), chunk_size):
+        records = table.records(rows[start:start + chunk_size])
+        if flatten:
+            records = [flatten_aspects(record) for record in records]
+        if fields:
+            records = [{key: record.get(key) for key in fields} for record in records]
+        yield ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records)
+
+
+def _partition_keys(table, rows):
+    """(hospital_id, 'YYYY-MM') per row, computed on the columns."""
+    hospital_ids = np.array([h[0] or 'unknown' for h in table.hospitals], dtype=object)[table.hospital[rows]]
+    timestamps = table.timestamp[rows]
+    months = timestamps.astype('datetime64[us]').astype('datetime64[M]').astype(str).astype(object)
+    months[timestamps < 0] = 'unknown'
+    return hospital_ids, months
+
+
+def _partition_table(table, rows, aspect_columns):
+    import pyarrow as pa
+
+    n = len(rows)
+    star = table.star[rows]
+    sentiment = table.sentiment[rows]
+    columns = {
+        'id': pa.array(table.id[rows]),
+        'hospital_name': pa.array([table.hospitals[c][1] for c in table.hospital[rows]]),
+        'hospital_address': pa.array([table.hospitals[c][2] for c in table.hospital[rows]]),
+        'review_text': pa.array([table.review_text[r] for r in rows]),
+        'timestamp': pa.array(table.timestamp[rows].astype('datetime64[us]'), type=pa.timestamp('us', tz='UTC'),
+                              mask=table.timestamp[rows] < 0),
+        'overall_sentiment': pa.DictionaryArray.from_arrays(
+            pa.array(np.where(sentiment < 0, 0, sentiment).astype(np.int8), mask=sentiment < 0),
+            pa.array(SENTIMENTS),
+        ),
+        'sentiment_score': pa.array(table.score[rows]),
+        'star_rating': pa.array(star, mask=star == 0),
+        'degraded': pa.array(table.degraded[rows]),
+    }
+
+    aspect_codes = table.aspect[rows]
+    aspect_pol = table.aspect_sentiment[rows]
+    for code, label in enumerate(table.aspect_labels):
+        name = aspect_column(label)
+        if name not in aspect_columns:
+            continue
+        hit = aspect_codes == code
+        found = hit.any(axis=1)
+        slot = hit.argmax(axis=1)
+        polarity = aspect_pol[np.arange(n), slot]
+        values = np.where(found & (polarity >= 0), polarity, 0).astype(np.int8)
+        columns[name] = pa.DictionaryArray.from_arrays(
+            pa.array(values, mask=~found | (polarity < 0)), pa.array(ASPECT_POLARITIES)
+        )
+    # Same schema in every partition, even for aspects absent from this one
+    for name in aspect_columns:
+        if name not in columns:
+            columns[name] = pa.DictionaryArray.from_arrays(
+                pa.nulls(n, type=pa.int8()), pa.array(ASPECT_POLARITIES)
+            )
+    return pa.table(columns)
+
+
+def write_parquet(table, rows, output_dir, compression='zstd'):
+    """Write ``rows`` as hospital_id=/month= partitions. Returns {partition_path: row_count}."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    aspect_columns = sorted({aspect_column(label) for label in table.aspect_labels})
+    hospital_ids, months = _partition_keys(table, rows)
+    id_values, id_codes = np.unique(hospital_ids, return_inverse=True)
+    month_values, month_codes = np.unique(months, return_inverse=True)
+    keys, inverse = np.unique(np.stack([id_codes, month_codes], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+
+    written = {}
+    for i, (id_code, month_code) in enumerate(keys):
+        hospital_id, month = id_values[id_code], month_values[month_code]
+        part_rows = rows[order[bounds[i]:bounds[i + 1]]]
+        part_dir = os.path.join(output_dir, f'hospital_id={hospital_id}', f'month={month}')
+        os.makedirs(part_dir, exist_ok=True)
+        pq.write_table(_partition_table(table, part_rows, aspect_columns),
+                       os.path.join(part_dir, 'part-0.parquet'), compression=compression)
+        written[part_dir] = len(part_rows)
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export reviews and analyses as NDJSON or partitioned Parquet.")
+    parser.add_argument('--format', choices=['ndjson', 'parquet'], default='parquet')
+    parser.add_argument('--output', required=True, help='Output file (ndjson, "-" for stdout) or directory (parquet)')
+    parser.add_argument('--reviews', default=REVIEWS_FILE)
+    parser.add_argument('--hospital-id')
+    parser.add_argument('--sentiment', choices=['positive', 'negative'])
+    parser.add_argument('--start', help='Only reviews at or after this ISO timestamp')
+    parser.add_argument('--end', help='Only reviews before this ISO timestamp')
+    parser.add_argument('--flatten', action='store_true', help='NDJSON: flatten aspects into aspect_<name> keys')
+    args = parser.parse_args()
+
+    with open(args.reviews, 'r', encoding='utf-8') as f:
+        table = ReviewTable.from_records(json.load(f))
+    hospital_id = args.hospital_id
+    if hospital_id:
+        # Old ids of merged hospitals export the hospital they were merged into
+        registry = HospitalRegistry()
+        registry.load()
+        hospital_id = registry.canonical_id(hospital_id) or hospital_id
+    rows = table.filter(hospital_id=hospital_id, sentiment=args.sentiment, start=args.start, end=args.end)
+    # Oldest first reads naturally in an export
+    rows = rows[::-1]
+
+    if args.format == 'ndjson':
+        out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+        try:
+            for chunk in ndjson_chunks(table, rows, flatten=args.flatten):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        if out is not sys.stdout:
+            print(f"✅ Exported {len(rows)} reviews to {args.output}")
+    else:
+        written = write_parquet(table, rows, args.output)
+        print(f"✅ Exported {len(rows)} reviews into {len(written)} partitions under {args.output}")
@@ -0,0 +1,58 @@
+"""
+Production serving config: gunicorn -c gunicorn.conf.py app:app
+
+The app (and with it every transformer pipeline in nlp_analyzer) is imported
+once in the master process, then workers are forked from it. Model weights
+live in tensor storage that workers only read, so the pages stay shared
+copy-on-write instead of being loaded once per worker.
+
+Environment:
+  WEB_WORKERS     number of worker processes (default 2)
+  WEB_THREADS     threads per worker (default 8)
+  SSE_MAX_STREAMS open /api/reviews/stream connections per worker (default
+                  WEB_THREADS // 2). Each stream holds a thread for as long as
+                  the dashboard tab is open, so this keeps the other half of the
+                  threads for /api/analyze and the rest of the API. Tabs past
+                  the cap get pending changes and reconnect every 10s instead.
+  TORCH_THREADS   intra-op threads per worker (default: cores / workers)
+  ANALYZER_PARALLEL_STAGES  model stages run concurrently inside one request
+                  ('auto' = one per thread of the worker's budget, 1 = sequential)
+  BIND            listen address (default 127.0.0.1:5000)
+"""
+import gc
+import os
+
+bind = os.environ.get('BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('WEB_WORKERS', '2'))
+threads = int(os.environ.get('WEB_THREADS', '8'))
+worker_class = 'gthread'
+preload_app = True
+# Model inference on a long review can take a while on CPU
+timeout = int(os.environ.get('WEB_TIMEOUT', '120'))
+# SSE connections stay open; keep idle keep-alive short for everything else
+keepalive = 5
+
+
+def _torch_threads_per_worker():
+    configured = os.environ.get('TORCH_THREADS')
+    if configured:
+        return int(configured)
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def when_ready(server):
+    import torch
+    if torch.cuda.is_available() and workers > 1:
+        server.log.warning(
+            "CUDA is initialized in the master; forked workers cannot share a CUDA context. "
+            "Use WEB_WORKERS=1 on GPU nodes."
+        )
+    # Move everything allocated while loading the models into the permanent
+    # generation so the collector never writes to those pages in the workers.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from nlp_analyzer import set_torch_threads
+    n = set_torch_threads(_torch_threads_per_worker())
+    server.log.info("worker %s: torch intra-op threads = %s", worker.pid, n)
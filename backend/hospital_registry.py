@@ -0,0 +1,368 @@
+"""
+Hospital directory with stable ids and typeahead.
+
+Hospitals used to exist only as name/address strings repeated on every
+review, and a review posted without a hospital_id got a fresh id per review.
+The registry keeps one record per hospital in hospitals.json:
+
+    {"hospital_id": "H007", "name": "...", "address": "...",
+     "aliases": ["H980", ...], "review_count": 129}
+
+New reviews are matched to an existing hospital by normalized name and
+address before a new id is minted; the same name at a different address is a
+separate branch and gets its own record.
+``aliases`` keeps ids that were merged into this record so old references
+still resolve. migrate_hospital_ids.py moves reviews filed under an alias to
+the canonical id and records the aliases in hospital_aliases.json, which
+seeding reads back, so they survive hospitals.json being regenerated. The file is rewritten only when a hospital is added; the
+review_count in it is a snapshot, kept current in memory from the reviews.
+
+Typeahead: every word-start suffix of each normalized name is inserted into a
+character trie whose nodes cache the top SUGGEST_LIMIT hospitals by review
+count, so a prefix lookup costs O(len(prefix)) regardless of directory size.
+Misspellings fall back to a trigram index ranked by similarity.
+"""
+import heapq
+import json
+import os
+import re
+import threading
+
+HOSPITALS_FILE = 'hospitals.json'
+HOSPITAL_ALIASES_FILE = 'hospital_aliases.json'
+SUGGEST_LIMIT = 10
+FUZZY_MIN_SIMILARITY = 0.5
+
+
+def normalize_name(value: str) -> str:
+    """Casefold, drop apostrophes and punctuation, collapse whitespace."""
+    text = (value or '').casefold().replace("'", '').replace('’', '')
+    text = re.sub(r'[^0-9a-z]+', ' ', text)
+    return text.strip()
+
+
+def _trigrams(text: str):
+    grams = set()
+    for word in text.split():
+        padded = f' {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class _TrieNode:
+    __slots__ = ('children', 'top', 'codes')
+
+    def __init__(self):
+        self.children = {}
+        self.top = []  # hospital codes, best first, at most SUGGEST_LIMIT
+        self.codes = set()  # every hospital code passing through this node
+
+
+class HospitalRegistry:
+    def __init__(self, path: str = HOSPITALS_FILE, aliases_path: str = HOSPITAL_ALIASES_FILE):
+        self.path = path
+        self.aliases_path = aliases_path
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._reset()
+
+    def _reset(self):
+        self.hospitals = []      # code -> record dict
+        self._by_id = {}         # hospital_id or alias -> code
+        self._by_name = {}       # normalized name -> [codes]
+        self._trie = _TrieNode()
+        self._trigrams = {}      # trigram -> set of codes
+        self._max_number = 0     # highest numeric part of an 'H<n>' id seen
+        self._unsaved = set()    # codes minted by resolve() and not yet on disk
+        self._counts_stamp = None
+
+    # -- persistence -----------------------------------------------------------
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def load(self, seed_reviews=None):
+        """
+        Load hospitals.json, or build it from ``seed_reviews`` (a callable
+        returning the review list) the first time. Cheap when nothing changed.
+        """
+        with self._lock:
+            stamp = self._file_stamp()
+            if stamp is not None and stamp == self._stamp:
+                return
+            self._reset()
+            if stamp is None:
+                if seed_reviews is not None:
+                    self._seed(seed_reviews())
+                    self.save()
+                return
+            with open(self.path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            for record in records:
+                self._index(record)
+            self._stamp = stamp
+
+    def save(self):
+        with self._lock:
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.hospitals, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._stamp = self._file_stamp()
+            self._unsaved.clear()
+
+    def _seed(self, reviews):
+        for review in reviews:
+            hospital_id = review.get('hospital_id')
+            code = self._by_id.get(hospital_id)
+            if code is None:
+                code = self._match(review.get('hospital_name'), review.get('hospital_address'))
+                if code is None:
+                    code = self._index({
+                        'hospital_id': hospital_id or self._next_id(),
+                        'name': review.get('hospital_name', ''),
+                        'address': review.get('hospital_address', ''),
+                        'aliases': [],
+                        'review_count': 0,
+                    })
+                elif hospital_id:
+                    # Same hospital under another id (the old per-review ids)
+                    self.hospitals[code]['aliases'].append(hospital_id)
+                    self._by_id[hospital_id] = code
+                    self._note_id(hospital_id)
+            self.hospitals[code]['review_count'] += 1
+        self._seed_aliases()
+        for code in range(len(self.hospitals)):
+            self._rank(code)
+
+    def _seed_aliases(self):
+        """Re-attach aliases recorded by a migration ({alias: canonical id})."""
+        if not os.path.exists(self.aliases_path):
+            return
+        with open(self.aliases_path, 'r', encoding='utf-8') as f:
+            recorded = json.load(f)
+        for alias, canonical in recorded.items():
+            code = self._by_id.get(canonical)
+            if code is None or alias in self._by_id:
+                continue
+            self.hospitals[code]['aliases'].append(alias)
+            self._by_id[alias] = code
+            self._note_id(alias)
+
+    # -- indexing --------------------------------------------------------------
+
+    def _index(self, record):
+        code = len(self.hospitals)
+        record.setdefault('aliases', [])
+        record.setdefault('review_count', 0)
+        self.hospitals.append(record)
+        for hospital_id in [record['hospital_id']] + record['aliases']:
+            self._by_id[hospital_id] = code
+            self._note_id(hospital_id)
+        normalized = normalize_name(record['name'])
+        self._by_name.setdefault(normalized, []).append(code)
+        for gram in _trigrams(normalized):
+            self._trigrams.setdefault(gram, set()).add(code)
+        self._rank(code)
+        return code
+
+    def _trie_paths(self, code):
+        """Trie nodes along every word-start suffix of the hospital's name."""
+        normalized = normalize_name(self.hospitals[code]['name'])
+        words = normalized.split(' ')
+        seen = set()
+        for i in range(len(words)):
+            node = self._trie
+            for ch in ' '.join(words[i:]):
+                node = node.children.setdefault(ch, _TrieNode())
+                if id(node) not in seen:
+                    seen.add(id(node))
+                    yield node
+
+    def _sort_key(self, code):
+        record = self.hospitals[code]
+        return (-record['review_count'], record['name'])
+
+    def _rank(self, code, dropped=False):
+        """
+        (Re)place ``code`` in the cached top list of every trie node it passes
+        through. ``dropped``: its count went down, so where it was in a top
+        list, that list is rebuilt from all the node's hospitals (one pruned
+        earlier may now belong in it).
+        """
+        key = self._sort_key(code)
+        for node in self._trie_paths(code):
+            node.codes.add(code)
+            if dropped and code in node.top:
+                node.top = heapq.nsmallest(SUGGEST_LIMIT, node.codes, key=self._sort_key)
+                continue
+            if code in node.top:
+                node.top.remove(code)
+            if len(node.top) < SUGGEST_LIMIT or key < self._sort_key(node.top[-1]):
+                node.top.append(code)
+                node.top.sort(key=self._sort_key)
+                del node.top[SUGGEST_LIMIT:]
+
+    def _note_id(self, hospital_id):
+        match = re.fullmatch(r'H(\d+)', hospital_id or '')
+        if match:
+            self._max_number = max(self._max_number, int(match.group(1)))
+
+    def _next_id(self):
+        return f'H{self._max_number + 1:03d}'
+
+    def _match(self, name, address=None):
+        """
+        Code of the hospital with this name and address. A name alone matches
+        the first record; an address that differs from every same-name record
+        is another branch, so no match (records without an address still match).
+        """
+        codes = self._by_name.get(normalize_name(name))
+        if not codes:
+            return None
+        wanted = normalize_name(address)
+        if not wanted:
+            return codes[0]
+        for code in codes:
+            if normalize_name(self.hospitals[code]['address']) == wanted:
+                return code
+        for code in codes:
+            if not normalize_name(self.hospitals[code]['address']):
+                return code
+        return None
+
+    # -- public API ------------------------------------------------------------
+
+    def get(self, hospital_id: str):
+        with self._lock:
+            code = self._by_id.get(hospital_id)
+            return dict(self.hospitals[code]) if code is not None else None
+
+    def canonical_id(self, hospital_id: str):
+        """The id of the record ``hospital_id`` (possibly a merged alias) belongs to, or None."""
+        with self._lock:
+            code = self._by_id.get(hospital_id)
+            return self.hospitals[code]['hospital_id'] if code is not None else None
+
+    def alias_map(self) -> dict:
+        """{alias: canonical hospital_id} for every merged id."""
+        with self._lock:
+            return {alias: record['hospital_id'] for record in self.hospitals for alias in record['aliases']}
+
+    def all(self):
+        with self._lock:
+            return [dict(h) for h in sorted(self.hospitals, key=lambda h: (-h['review_count'], h['name']))]
+
+    def resolve(self, name: str, address: str = '', hospital_id: str = None, create: bool = True):
+        """
+        Return the registry record for a hospital named on a new review,
+        minting a new id only if nothing matches. Does not persist; call
+        ``record_review`` once the review is stored.
+        """
+        with self._lock:
+            code = self._by_id.get(hospital_id) if hospital_id else None
+            if code is None:
+                code = self._match(name, address)
+            if code is None:
+                if not create:
+                    return None
+                code = self._index({
+                    'hospital_id': hospital_id or self._next_id(),
+                    'name': (name or '').strip(),
+                    'address': (address or '').strip(),
+                    'aliases': [],
+                    'review_count': 0,
+                })
+                self._unsaved.add(code)
+            elif address and not self.hospitals[code]['address']:
+                self.hospitals[code]['address'] = address.strip()
+            return dict(self.hospitals[code])
+
+    def record_review(self, hospital_id: str):
+        """
+        Count a stored review towards the hospital's ranking. Only a newly
+        minted hospital is written to disk; the counts in hospitals.json are
+        a snapshot that ``sync_counts`` corrects from the reviews.
+        """
+        with self._lock:
+            code = self._by_id[hospital_id]
+            self.hospitals[code]['review_count'] += 1
+            self._rank(code)
+            if code in self._unsaved:
+                self.save()
+
+    def sync_counts(self, stamp, review_counts):
+        """
+        Take review counts from the review store when ``stamp`` (its file
+        stamp) moved since the last sync. ``review_counts()`` returns
+        {hospital_id: n}; only hospitals whose count changed are re-ranked.
+        """
+        with self._lock:
+            if stamp is not None and stamp == self._counts_stamp:
+                return
+            totals = {}
+            for hospital_id, count in review_counts().items():
+                code = self._by_id.get(hospital_id)
+                if code is not None:
+                    totals[code] = totals.get(code, 0) + count
+            for code, record in enumerate(self.hospitals):
+                count = totals.get(code, 0)
+                if record['review_count'] != count:
+                    dropped = count < record['review_count']
+                    record['review_count'] = count
+                    self._rank(code, dropped=dropped)
+            self._counts_stamp = stamp
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_LIMIT):
+        """Hospitals whose name has a word starting with ``prefix``; fuzzy matches fill the rest."""
+        limit = max(1, min(limit, SUGGEST_LIMIT))
+        query = normalize_name(prefix)
+        with self._lock:
+            if not query:
+                codes = sorted(range(len(self.hospitals)), key=self._sort_key)[:limit]
+                return [self._suggestion(code, 'prefix') for code in codes]
+
+            node = self._trie
+            for ch in query:
+                node = node.children.get(ch)
+                if node is None:
+                    break
+            prefix_codes = list(node.top[:limit]) if node is not None else []
+            results = [self._suggestion(code, 'prefix') for code in prefix_codes]
+            if len(results) >= limit:
+                return results
+
+            # Fuzzy fallback: share of the query's trigrams found in the name,
+            # so a misspelled single word still matches a long name
+            query_grams = _trigrams(query)
+            if not query_grams:
+                return results
+            overlap = {}
+            for gram in query_grams:
+                for code in self._trigrams.get(gram, ()):
+                    overlap[code] = overlap.get(code, 0) + 1
+            scored = []
+            taken = set(prefix_codes)
+            for code, shared in overlap.items():
+                if code in taken:
+                    continue
+                similarity = shared / len(query_grams)
+                if similarity >= FUZZY_MIN_SIMILARITY:
+                    scored.append((-similarity, self._sort_key(code), code))
+            scored.sort()
+            results += [self._suggestion(code, 'fuzzy') for _, _, code in scored[:limit - len(results)]]
+            return results
+
+    def _suggestion(self, code, match):
+        record = self.hospitals[code]
+        return {
+            'hospital_id': record['hospital_id'],
+            'name': record['name'],
+            'address': record['address'],
+            'review_count': record['review_count'],
+            'match': match,
+        }
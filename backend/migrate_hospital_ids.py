@@ -0,0 +1,73 @@
+"""
+One-time migration: file reviews of merged hospitals under the canonical id
+  • seeding the hospital directory merges hospitals that the old per-review
+    ids split up, keeping the extra ids as aliases; the reviews themselves
+    still carry the old ids, so filters, stats and trends see only part of
+    such a hospital until they are rewritten
+  • records every alias in hospital_aliases.json first, so old ids keep
+    resolving even if hospitals.json is deleted and re-seeded from the
+    rewritten reviews
+  • rewrites hospital_id on the affected reviews under the shared write lock
+    and publishes them on the change feed, so it is safe with the server up
+Usage: python migrate_hospital_ids.py [--dry-run]
+"""
+import argparse
+import json
+import os
+from change_feed import ChangeFeed
+from hospital_registry import HospitalRegistry
+from review_store import REVIEWS_FILE, load_reviews, save_reviews, reviews_write_lock
+
+
+def record_aliases(registry):
+    """Merge the registry's aliases into its aliases file. Returns the full map."""
+    recorded = {}
+    if os.path.exists(registry.aliases_path):
+        with open(registry.aliases_path, 'r', encoding='utf-8') as f:
+            recorded = json.load(f)
+    recorded.update(registry.alias_map())
+    tmp_path = f'{registry.aliases_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(recorded, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, registry.aliases_path)
+    return recorded
+
+
+def migrate(dry_run=False):
+    if not os.path.exists(REVIEWS_FILE):
+        print(f"❌ Error: {REVIEWS_FILE} not found!")
+        return
+
+    registry = HospitalRegistry()
+    registry.load(seed_reviews=load_reviews)
+    aliases = registry.alias_map()
+    print(f"✓ {len(registry.hospitals)} hospitals, {len(aliases)} merged ids")
+
+    if not dry_run:
+        recorded = record_aliases(registry)
+        print(f"💾 {len(recorded)} aliases recorded in {registry.aliases_path}")
+
+    with reviews_write_lock():
+        reviews = load_reviews()
+        changed_ids = []
+        for review in reviews:
+            canonical = registry.canonical_id(review.get('hospital_id'))
+            if canonical is not None and canonical != review['hospital_id']:
+                review['hospital_id'] = canonical
+                changed_ids.append(review['id'])
+        if changed_ids and not dry_run:
+            save_reviews(reviews)
+            # Let running servers and connected clients pick up the moved reviews
+            ChangeFeed().append(changed_ids)
+
+    if dry_run:
+        print(f"\n🔍 Dry run: {len(changed_ids)} of {len(reviews)} reviews would move to their canonical id")
+    else:
+        print(f"\n✅ Moved {len(changed_ids)} of {len(reviews)} reviews to their canonical hospital id")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rewrite hospital ids of reviews to their canonical hospital.")
+    parser.add_argument('--dry-run', action='store_true', help='Only report how many reviews would change')
+    args = parser.parse_args()
+    migrate(dry_run=args.dry_run)
@@ -0,0 +1,167 @@
+"""
+Local model artifact cache.
+
+`prepare_models.py` materializes every pipeline the analyzer uses into
+MODEL_ARTIFACT_DIR (default: ./model_artifacts):
+  • weights as safetensors, which load through mmap so several processes
+    share one copy in the page cache
+  • the fast (Rust) tokenizer serialized to tokenizer.json, so nothing is
+    converted from sentencepiece/vocab files at start-up
+  • manifest.json listing each model's files and sizes for a preflight check
+
+nlp_analyzer loads from here when a snapshot is present and falls back to the
+Hugging Face hub id otherwise. Set MODEL_ARTIFACTS_REQUIRED=1 on air-gapped
+nodes to fail fast instead of reaching for the hub.
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+
+# name -> (pipeline task, Hugging Face model id) for every pipeline nlp_analyzer builds
+MODEL_SPECS = {
+    'nlptown': ('text-classification', 'nlptown/bert-base-multilingual-uncased-sentiment'),
+    'setfit_sst5': ('text-classification', 'SetFit/distilbert-base-uncased__sst5__all-train'),
+    'aspect': ('zero-shot-classification', 'MoritzLaurer/DeBERTa-v3-base-mnli'),
+    'roberta': ('sentiment-analysis', 'siebert/sentiment-roberta-large-english'),
+    'distilbert': ('text-classification', 'distilbert-base-uncased-finetuned-sst-2-english'),
+}
+
+ARTIFACT_DIR = os.environ.get('MODEL_ARTIFACT_DIR', 'model_artifacts')
+MANIFEST_FILE = 'manifest.json'
+REQUIRED_FILES = ('config.json', 'model.safetensors', 'tokenizer.json')
+
+
+def artifacts_required() -> bool:
+    return os.environ.get('MODEL_ARTIFACTS_REQUIRED', '').lower() in {'1', 'true', 'yes'}
+
+
+def _snapshot_dirname(model_id: str) -> str:
+    return model_id.replace('/', '--')
+
+
+def snapshot_path(model_id: str, artifact_dir: str = None) -> str:
+    return os.path.join(artifact_dir or ARTIFACT_DIR, _snapshot_dirname(model_id))
+
+
+def load_manifest(artifact_dir: str = None):
+    path = os.path.join(artifact_dir or ARTIFACT_DIR, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def preflight(model_ids, artifact_dir: str = None):
+    """
+    Check that a snapshot exists and is complete for every model id.
+
+    Returns a dict of model_id -> list of problems (empty list = ready).
+    Only file presence and sizes are checked, so this is cheap enough to run
+    on every start.
+    """
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    manifest = load_manifest(artifact_dir) or {}
+    entries = manifest.get('models', {})
+    report = {}
+    for model_id in model_ids:
+        problems = []
+        entry = entries.get(model_id)
+        directory = snapshot_path(model_id, artifact_dir)
+        if entry is None:
+            problems.append('not in manifest')
+        elif not os.path.isdir(directory):
+            problems.append(f'missing directory {directory}')
+        else:
+            expected = entry.get('files', {})
+            for name in REQUIRED_FILES:
+                if name not in expected:
+                    problems.append(f'{name} not recorded in manifest')
+            for name, size in expected.items():
+                path = os.path.join(directory, name)
+                if not os.path.exists(path):
+                    problems.append(f'missing {name}')
+                elif os.path.getsize(path) != size:
+                    problems.append(f'{name} has size {os.path.getsize(path)}, expected {size}')
+        report[model_id] = problems
+    return report
+
+
+def load_pipeline(task: str, model_id: str, device: int):
+    """Build a transformers pipeline from the local snapshot if it passes preflight, else from the hub."""
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline
+
+    problems = preflight([model_id])[model_id]
+    if problems:
+        if artifacts_required():
+            raise RuntimeError(
+                f"Model artifact for {model_id} is not usable ({'; '.join(problems)}). "
+                f"Run `python prepare_models.py` to populate {ARTIFACT_DIR}."
+            )
+        return pipeline(task, model=model_id, device=device)
+
+    directory = snapshot_path(model_id)
+    model = AutoModelForSequenceClassification.from_pretrained(
+        directory,
+        local_files_only=True,
+        use_safetensors=True,
+        low_cpu_mem_usage=True,
+    )
+    tokenizer = AutoTokenizer.from_pretrained(directory, local_files_only=True, use_fast=True)
+    return pipeline(task, model=model, tokenizer=tokenizer, device=device)
+
+
+def prepare(model_specs, artifact_dir: str = None, force: bool = False, log=print):
+    """
+    Download (or read from the hub cache) and write optimized snapshots.
+
+    model_specs: mapping of name -> (task, model_id), like MODEL_SPECS.
+    Each snapshot is written to a temp directory and renamed into place, so
+    an interrupted run never leaves a half-written snapshot that passes
+    preflight.
+    """
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    import transformers
+
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    os.makedirs(artifact_dir, exist_ok=True)
+    manifest = load_manifest(artifact_dir) or {'models': {}}
+    status = preflight([model_id for _, model_id in model_specs.values()], artifact_dir)
+
+    for name, (task, model_id) in model_specs.items():
+        if not force and not status[model_id]:
+            log(f"  ✓ {model_id} already prepared")
+            continue
+        log(f"  🔄 {model_id} ({task})...")
+        final_dir = snapshot_path(model_id, artifact_dir)
+        tmp_dir = final_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        tokenizer = AutoTokenizer.from_pretrained(model_id, use_fast=True)
+        if not getattr(tokenizer, 'is_fast', False):
+            raise RuntimeError(f"{model_id}: no fast tokenizer available to serialize")
+        model = AutoModelForSequenceClassification.from_pretrained(model_id)
+        model.eval()
+        model.save_pretrained(tmp_dir, safe_serialization=True)
+        tokenizer.save_pretrained(tmp_dir)
+
+        files = {}
+        for filename in sorted(os.listdir(tmp_dir)):
+            files[filename] = os.path.getsize(os.path.join(tmp_dir, filename))
+
+        shutil.rmtree(final_dir, ignore_errors=True)
+        os.replace(tmp_dir, final_dir)
+        manifest['models'][model_id] = {
+            'name': name,
+            'task': task,
+            'files': files,
+            'prepared_at': datetime.utcnow().isoformat() + 'Z',
+            'transformers_version': transformers.__version__,
+        }
+        # Save after every model so progress survives an interrupted run
+        with open(os.path.join(artifact_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        size_mb = sum(files.values()) / (1024 * 1024)
+        log(f"  ✓ {model_id}: {len(files)} files, {size_mb:.0f} MB")
+
+    return preflight([model_id for _, model_id in model_specs.values()], artifact_dir)
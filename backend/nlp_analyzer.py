@@ -1,6 +1,12 @@
-from transformers import pipeline
+from model_artifacts import MODEL_SPECS, load_pipeline
+from aspect_clauses import analyze_aspects
+import profiling
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import os
 import re
 import emoji
+import threading
 import torch
 import warnings
 
@@ -9,38 +15,19 @@ warnings.filterwarnings('ignore', category=FutureWarning)
 
 DEVICE = 0 if torch.cuda.is_available() else -1
 
-# Unified model set: binary ensemble + star estimators for stability
+# Unified model set: binary ensemble + star estimators for stability.
+# Loaded from the local artifact cache when prepared (see prepare_models.py).
 star_rating_models = {
-    'nlptown': pipeline(
-        "text-classification",
-        model="nlptown/bert-base-multilingual-uncased-sentiment",
-        device=DEVICE,
-    ),
-    'setfit_sst5': pipeline(
-        "text-classification",
-        model="SetFit/distilbert-base-uncased__sst5__all-train",
-        device=DEVICE,
-    ),
+    'nlptown': load_pipeline(*MODEL_SPECS['nlptown'], device=DEVICE),
+    'setfit_sst5': load_pipeline(*MODEL_SPECS['setfit_sst5'], device=DEVICE),
 }
 
 # DeBERTa MNLI for aspects (requires protobuf and sentencepiece installed)
-aspect_classifier = pipeline(
-    "zero-shot-classification",
-    model="MoritzLaurer/DeBERTa-v3-base-mnli",
-    device=DEVICE,
-)
+aspect_classifier = load_pipeline(*MODEL_SPECS['aspect'], device=DEVICE)
 
 binary_sentiment_models = {
-    'roberta': pipeline(
-        "sentiment-analysis",
-        model="siebert/sentiment-roberta-large-english",
-        device=DEVICE,
-    ),
-    'distilbert': pipeline(
-        "text-classification",
-        model="distilbert-base-uncased-finetuned-sst-2-english",
-        device=DEVICE,
-    ),
+    'roberta': load_pipeline(*MODEL_SPECS['roberta'], device=DEVICE),
+    'distilbert': load_pipeline(*MODEL_SPECS['distilbert'], device=DEVICE),
 }
 
 POSITIVE_OUTCOME_TOKENS = {
@@ -66,9 +53,11 @@ _WAIT_TIME_ALIASES = [
     'Delays',
 ]
 
-_CANONICAL_ASPECT_MAP = {value.lower(): value for value in ASPECT_LABELS.values()}
-for alias in _WAIT_TIME_ALIASES:
-    _CANONICAL_ASPECT_MAP[alias.lower()] = ASPECT_LABELS['wait_time']
+# Canonical aspect -> zero-shot labels asked for it ("<label> positive/negative")
+_ASPECT_HYPOTHESES = {label: [label] for label in ASPECT_LABELS.values()}
+_ASPECT_HYPOTHESES[ASPECT_LABELS['wait_time']] = list(dict.fromkeys([ASPECT_LABELS['wait_time']] + _WAIT_TIME_ALIASES))
+_HYPOTHESIS_TEMPLATE = 'This example is {}.'  # the zero-shot pipeline's default
+ASPECT_BATCH_SIZE = int(os.environ.get('ASPECT_BATCH_SIZE', 32))
 
 CONTRACTIONS = {
     "isn't": "is not",
@@ -126,61 +115,48 @@ def _convert_emojis_to_text(text: str) -> str:
 
 
 
-def _canonicalize_aspect(label: str) -> str:
-    if not label:
-        return ''
-    return _CANONICAL_ASPECT_MAP.get(label.strip().lower(), '')
+def _score_aspect_pairs(premises, hypotheses):
+    """
+    Entailment probability of each (clause, aspect label) pair, computed the
+    way the zero-shot pipeline does with multi_label=True, but for arbitrary
+    pairs and ASPECT_BATCH_SIZE pairs per forward pass.
+    """
+    model = aspect_classifier.model
+    tokenizer = aspect_classifier.tokenizer
+    entailment_id = aspect_classifier.entailment_id
+    contradiction_id = -1 if entailment_id == 0 else 0
+    # Similar lengths in one batch keep padding small
+    order = sorted(range(len(premises)), key=lambda i: len(premises[i]))
+    probabilities = [0.0] * len(premises)
+    for start in range(0, len(order), ASPECT_BATCH_SIZE):
+        batch = order[start:start + ASPECT_BATCH_SIZE]
+        # Lock per batch so a long re-analysis doesn't starve live requests
+        with _model_lock('aspect'), torch.inference_mode():
+            inputs = tokenizer(
+                [premises[i] for i in batch],
+                [_HYPOTHESIS_TEMPLATE.format(hypotheses[i]) for i in batch],
+                padding=True, truncation='only_first', return_tensors='pt',
+            ).to(model.device)
+            logits = model(**inputs).logits[:, [contradiction_id, entailment_id]]
+            entailment = logits.softmax(dim=-1)[:, 1].tolist()
+        for i, probability in zip(batch, entailment):
+            probabilities[i] = probability
+    return probabilities
+
+
+def analyze_aspects_batch(texts):
+    """Clause-level aspects for a set of reviews, with all clause/label pairs scored together."""
+    return analyze_aspects(texts, _ASPECT_HYPOTHESES, _score_aspect_pairs)
 
 
 def _model_aspect_analysis(text: str):
     if not text or not text.strip():
         return []
-
-    candidate_labels = []
-    seen = set()
-
-    def _add_candidate(label: str):
-        if label in seen:
-            return
-        seen.add(label)
-        candidate_labels.append(f"{label} positive")
-        candidate_labels.append(f"{label} negative")
-
-    for label in ASPECT_LABELS.values():
-        _add_candidate(label)
-    for alias in _WAIT_TIME_ALIASES:
-        _add_candidate(alias)
-
     try:
-        result = aspect_classifier(text, candidate_labels=candidate_labels, multi_label=True)
+        return analyze_aspects_batch([text])[0]
     except Exception:
         return []
 
-    scores = {}
-    for lbl, score in zip(result.get('labels', []), result.get('scores', [])):
-        parts = lbl.split(' ', 1)
-        if len(parts) != 2:
-            continue
-        aspect_label, sentiment = parts
-        canonical = _canonicalize_aspect(aspect_label)
-        if not canonical:
-            continue
-        scores.setdefault(canonical, {})[sentiment] = score
-
-    findings = []
-    for aspect_label, sent_dict in scores.items():
-        pos_score = sent_dict.get('positive', 0)
-        neg_score = sent_dict.get('negative', 0)
-        if max(pos_score, neg_score) < 0.3:
-            continue
-        sentiment = 'positive' if pos_score >= neg_score else 'negative'
-        strength = round(abs(pos_score - neg_score), 2)
-        findings.append({'aspect': aspect_label, 'sentiment': sentiment, 'strength': strength})
-
-    findings.sort(key=lambda item: item.get('strength', 0), reverse=True)
-    trimmed = [{'aspect': item['aspect'], 'sentiment': item['sentiment']} for item in findings[:4]]
-    return trimmed
-
 
 def _label_to_star(label: str) -> int:
     if not label:
@@ -211,19 +187,22 @@ def _label_to_star(label: str) -> int:
     return 3
 
 
-def _run_star_models(text: str):
-    results = []
-    for name, model in star_rating_models.items():
-        try:
+def _run_star_model(name: str, model, text: str):
+    try:
+        with _model_lock(name):
             res = model(text[:512])[0]
-            results.append({
-                'model': name,
-                'star': _label_to_star(res.get('label')),
-                'score': float(res.get('score', 0) or 0),
-            })
-        except Exception:
-            continue
-    return results
+        return {
+            'model': name,
+            'star': _label_to_star(res.get('label')),
+            'score': float(res.get('score', 0) or 0),
+        }
+    except Exception:
+        return None
+
+
+def _run_star_models(text: str):
+    results = [_run_star_model(name, model, text) for name, model in star_rating_models.items()]
+    return [res for res in results if res is not None]
 
 
 def _aggregate_star_results(star_results):
@@ -255,21 +234,24 @@ def preprocess_review(text: str) -> str:
     return cleaned.strip()
 
 
-def _run_binary_models(text: str):
-    results = []
-    for name, model in binary_sentiment_models.items():
-        try:
+def _run_binary_model(name: str, model, text: str):
+    try:
+        with _model_lock(name):
             res = model(text[:512])[0]
-            label = res.get('label', '').lower()
-            sentiment = 'positive' if label.startswith('pos') else 'negative'
-            results.append({
-                'model': name,
-                'sentiment': sentiment,
-                'score': float(res.get('score', 0) or 0),
-            })
-        except Exception:
-            continue
-    return results
+        label = res.get('label', '').lower()
+        sentiment = 'positive' if label.startswith('pos') else 'negative'
+        return {
+            'model': name,
+            'sentiment': sentiment,
+            'score': float(res.get('score', 0) or 0),
+        }
+    except Exception:
+        return None
+
+
+def _run_binary_models(text: str):
+    results = [_run_binary_model(name, model, text) for name, model in binary_sentiment_models.items()]
+    return [res for res in results if res is not None]
 
 
 def _aggregate_sentiment(star_rating, star_weight, binary_results):
@@ -323,29 +305,167 @@ def get_analysis_mode() -> str:
     return _ACTIVE_MODE
 
 
-def analyze_review(text: str):
+# Execution planner: the star models, binary models and aspect classifier are
+# independent, so analyze_review can run them side by side. torch releases the
+# GIL inside forward passes, so a thread pool is enough; the intra-op thread
+# budget is split across the concurrent stages so they don't oversubscribe.
+# Threads that don't divide evenly go to the slowest models first.
+_MODEL_LOCKS = {}
+_MODEL_LOCKS_GUARD = threading.Lock()
+_EXECUTION_PLAN = None
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+MAX_STAGES = len(star_rating_models) + len(binary_sentiment_models) + 1
+# Stages, slowest first: roberta-large, then the DeBERTa aspect model
+STAGE_COST_ORDER = ['roberta', 'aspects', 'nlptown', 'setfit_sst5', 'distilbert']
+
+
+def _model_lock(name: str):
+    """One lock per pipeline: a pipeline (and its tokenizer) must not run twice at once."""
+    with _MODEL_LOCKS_GUARD:
+        return _MODEL_LOCKS.setdefault(name, threading.Lock())
+
+
+def configure_execution(total_threads: int = None, parallel_stages=None) -> dict:
+    """
+    Plan how analyze_review runs its model stages on this process.
+
+    total_threads: intra-op thread budget for the process (default: all cores,
+        or TORCH_THREADS). parallel_stages: how many stages may run at once;
+        'auto' (default, or ANALYZER_PARALLEL_STAGES) uses one per core up to
+        the number of stages, 1 runs them sequentially.
+    """
+    global _EXECUTION_PLAN, _EXECUTOR
+    if total_threads is None:
+        total_threads = int(os.environ.get('TORCH_THREADS') or os.cpu_count() or 1)
+    total_threads = max(1, int(total_threads))
+    if parallel_stages is None:
+        parallel_stages = os.environ.get('ANALYZER_PARALLEL_STAGES', 'auto')
+    if str(parallel_stages).lower() == 'auto':
+        # Stages on a GPU share one device queue; overlapping them buys little.
+        parallel_stages = 1 if DEVICE >= 0 else total_threads
+    parallel_stages = max(1, min(MAX_STAGES, int(parallel_stages)))
+    threads_per_stage = max(1, total_threads // parallel_stages)
+    # At most ``parallel_stages`` stages run at once and at most ``remainder``
+    # of them hold an extra thread, so concurrent stages never exceed the budget
+    remainder = total_threads - threads_per_stage * parallel_stages
+    stage_threads = {
+        name: threads_per_stage + (1 if rank < remainder else 0)
+        for rank, name in enumerate(STAGE_COST_ORDER)
+    }
+
+    torch.set_num_threads(threads_per_stage)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before the inter-op pool has started.
+        pass
+
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False)
+            _EXECUTOR = None
+        _EXECUTION_PLAN = {
+            'parallel_stages': parallel_stages,
+            'threads_per_stage': threads_per_stage,
+            'stage_threads': stage_threads,
+            'total_threads': total_threads,
+        }
+    return dict(_EXECUTION_PLAN)
+
+
+def get_execution_plan() -> dict:
+    if _EXECUTION_PLAN is None:
+        configure_execution()
+    return dict(_EXECUTION_PLAN)
+
+
+def set_torch_threads(num_threads: int) -> int:
+    """Set this process's intra-op thread budget (call once per worker, after fork)."""
+    return configure_execution(total_threads=num_threads)['total_threads']
+
+
+def _get_executor():
+    global _EXECUTOR
+    plan = get_execution_plan()
+    if plan['parallel_stages'] < 2:
+        return None
+    with _EXECUTOR_LOCK:
+        # Created lazily so no threads exist in a gunicorn master before fork.
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=plan['parallel_stages'], thread_name_prefix='analyzer-stage'
+            )
+        return _EXECUTOR
+
+
+def _with_threads(num_threads: int, fn, *args):
+    """Call ``fn`` with the calling thread's intra-op budget set to ``num_threads``."""
+    previous = torch.get_num_threads()
+    if previous == num_threads:
+        return fn(*args)
+    torch.set_num_threads(num_threads)
+    try:
+        return fn(*args)
+    finally:
+        torch.set_num_threads(previous)
+
+
+def _run_stages(stages):
+    """
+    Run independent (name, zero-argument callable) stages; results come back
+    in input order. Each stage runs with its share of the thread budget.
+    """
+    plan = get_execution_plan()
+    # A traced request runs its stages on its own thread, where cProfile sees them
+    executor = _get_executor() if len(stages) > 1 and not profiling.is_profiling() else None
+    if executor is None:
+        return [_with_threads(plan['total_threads'], stage) for _, stage in stages]
+    threads = plan['stage_threads']
+    futures = [
+        executor.submit(_with_threads, threads.get(name, plan['threads_per_stage']), stage)
+        for name, stage in stages
+    ]
+    return [future.result() for future in futures]
+
+
+def analyze_review(text: str, mode: str = None, include_aspects: bool = True):
+    """
+    Analyze one review. ``mode`` overrides the global analysis mode for this
+    call and ``include_aspects=False`` skips the zero-shot aspect model; both
+    exist so callers can trade accuracy for latency under load.
+    """
     raw_text = text or ''
     cleaned_text = preprocess_review(raw_text)
     text_for_models = cleaned_text or raw_text
 
-    normalized_mode = _ACTIVE_MODE
+    normalized_mode = mode if mode in VALID_MODES else _ACTIVE_MODE
 
     run_star = normalized_mode in {'combined', 'star'}
     run_binary = normalized_mode in {'combined', 'binary'}
 
-    star_results = []
+    stages = []
+    if run_star:
+        stages += [('star', name, partial(_run_star_model, name, model, text_for_models))
+                   for name, model in star_rating_models.items()]
+    if run_binary:
+        stages += [('binary', name, partial(_run_binary_model, name, model, text_for_models))
+                   for name, model in binary_sentiment_models.items()]
+    if include_aspects:
+        stages.append(('aspects', 'aspects', partial(_model_aspect_analysis, raw_text)))
+
+    outputs = _run_stages([(name, stage) for _, name, stage in stages])
+    star_results = [out for (kind, _, _), out in zip(stages, outputs) if kind == 'star' and out is not None]
+    binary_results = [out for (kind, _, _), out in zip(stages, outputs) if kind == 'binary' and out is not None]
+    aspects = outputs[-1] if include_aspects else []
+
     star_rating = None
     star_weight = 0.0
     if run_star:
-        star_results = _run_star_models(text_for_models)
         star_rating, star_weight = _aggregate_star_results(star_results)
 
-    binary_results = _run_binary_models(text_for_models) if run_binary else []
-
     sentiment_label, confidence, _votes = _aggregate_sentiment(star_rating, star_weight, binary_results)
 
-    aspects = _model_aspect_analysis(raw_text)
-
     strong_failure = re.search(r"(didn't help|did not help|didn't work|did not work|no improvement|procedure (didn't|did not) help|treatment failed)", raw_text, flags=re.IGNORECASE)
     has_positive_outcome = any(tok in cleaned_text.split() for tok in POSITIVE_OUTCOME_TOKENS)
 
@@ -360,3 +480,21 @@ def analyze_review(text: str):
         'star_rating': star_rating,
         'aspects': aspects,
     }
+
+
+def analyze_reviews(texts, mode: str = None):
+    """
+    analyze_review for a set of reviews. Sentiment runs per review; the aspect
+    model runs once over the whole set, so clauses shared between reviews are
+    scored once and the forward passes are full batches. If the aspect model
+    fails, every result's 'aspects' is None so callers can keep what they have.
+    """
+    results = [analyze_review(text, mode=mode, include_aspects=False) for text in texts]
+    try:
+        # Nothing else of this call runs alongside the batched pass: give it every thread
+        batch_aspects = _with_threads(get_execution_plan()['total_threads'], analyze_aspects_batch, texts)
+    except Exception:
+        batch_aspects = [None] * len(texts)
+    for result, aspects in zip(results, batch_aspects):
+        result['aspects'] = aspects
+    return results
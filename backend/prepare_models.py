@@ -0,0 +1,52 @@
+"""
+Materialize all analyzer models into a local artifact directory
+Each model is saved as safetensors weights plus a serialized fast tokenizer,
+with a manifest used for the start-up preflight check in nlp_analyzer.
+Run once with network access (or a populated hub cache), then copy the
+directory to air-gapped nodes and set MODEL_ARTIFACTS_REQUIRED=1.
+Usage: python prepare_models.py [--output model_artifacts] [--force] [--check]
+"""
+import argparse
+import os
+import sys
+import time
+from model_artifacts import ARTIFACT_DIR, MODEL_SPECS, prepare, preflight
+
+
+def _print_report(report):
+    ready = True
+    for model_id, problems in report.items():
+        if problems:
+            ready = False
+            print(f"  ❌ {model_id}: {'; '.join(problems)}")
+        else:
+            print(f"  ✓ {model_id}")
+    return ready
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prepare local model snapshots for fast, offline start-up.")
+    parser.add_argument('--output', default=ARTIFACT_DIR, help='Artifact directory (default: MODEL_ARTIFACT_DIR or ./model_artifacts)')
+    parser.add_argument('--force', action='store_true', help='Rebuild snapshots even if they pass preflight')
+    parser.add_argument('--check', action='store_true', help='Only run the preflight check')
+    args = parser.parse_args()
+
+    model_ids = [model_id for _, model_id in MODEL_SPECS.values()]
+
+    print("=" * 60)
+    print("Model Artifact Preparation")
+    print("=" * 60)
+    print(f"Artifact directory: {os.path.abspath(args.output)}")
+    print()
+
+    if args.check:
+        ok = _print_report(preflight(model_ids, args.output))
+        sys.exit(0 if ok else 1)
+
+    started = time.time()
+    report = prepare(MODEL_SPECS, artifact_dir=args.output, force=args.force)
+    print(f"\n📋 Preflight ({time.time() - started:.0f}s):")
+    ok = _print_report(report)
+    if ok:
+        print(f"\n✅ All models ready. Start the server with MODEL_ARTIFACT_DIR={args.output}")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,235 @@
+"""
+On-demand profiling of the running server.
+
+  • sampling: snapshot every thread's Python stack with sys._current_frames()
+    at a fixed interval for a bounded time and count identical stacks. The
+    result is in collapsed ("folded") format - one `frame;frame;frame count`
+    line per stack - which flamegraph.pl, speedscope and inferno read
+    directly. Samples are wall-clock, so time spent waiting on a lock or on
+    I/O shows up as well as time spent computing.
+  • per-request: cProfile around a single request, opted into with the
+    X-Profile header. Stats are dumped to PROFILE_DIR as .prof files
+    (pstats / snakeviz format). The analyzer runs its model stages inline
+    on the traced thread (see is_profiling) so they show up in the trace.
+
+Both are off unless PROFILING_TOKEN is set; the admin endpoints and the
+X-Profile header must present that token. When disabled, the per-request
+hook costs one attribute check.
+
+Usage (against a running server, PROFILING_TOKEN exported):
+  python profiling.py --url http://localhost:5000 --seconds 15 --output analyze.folded
+Usage (profile a script in-process):
+  python profiling.py --seconds 120 --output reanalyze.folded --run reanalyze_reviews.py
+"""
+import argparse
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import runpy
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN') or None
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+MAX_SAMPLE_SECONDS = 60
+DEFAULT_INTERVAL = 0.005
+
+_sampling_lock = threading.Lock()
+# cProfile can only be active once per interpreter on newer Pythons, and
+# overlapping traces would skew each other anyway: one request at a time.
+_request_lock = threading.Lock()
+_profiled_thread = None  # ident of the thread whose request is being traced
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def enabled() -> bool:
+    return PROFILING_TOKEN is not None
+
+
+def check_token(value) -> bool:
+    return enabled() and value is not None and hmac.compare_digest(value, PROFILING_TOKEN)
+
+
+# -- sampling profiler ---------------------------------------------------------
+
+def _short_path(filename):
+    marker = 'site-packages' + os.sep
+    if marker in filename:
+        return filename.split(marker, 1)[1]
+    return os.path.basename(filename)
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    # ';' separates frames in the folded format
+    return f'{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':')
+
+
+def _folded_stack(frame, thread_name):
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name.replace(';', ':'))
+    return ';'.join(reversed(labels))
+
+
+def sample(seconds: float, interval: float = DEFAULT_INTERVAL, stop: threading.Event = None):
+    """
+    Sample all other threads for ``seconds`` (or until ``stop`` is set).
+
+    Returns (Counter of folded stack -> samples, number of sampling ticks).
+    Raises ProfilerBusy if a sampling profile is already running.
+    """
+    if not _sampling_lock.acquire(blocking=False):
+        raise ProfilerBusy('a sampling profile is already running')
+    try:
+        me = threading.get_ident()
+        counts = Counter()
+        ticks = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not (stop and stop.is_set()):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    counts[_folded_stack(frame, names.get(ident, f'thread-{ident}'))] += 1
+            ticks += 1
+            time.sleep(interval)
+        return counts, ticks
+    finally:
+        _sampling_lock.release()
+
+
+def format_folded(counts) -> str:
+    return ''.join(f'{stack} {count}\n' for stack, count in counts.most_common())
+
+
+# -- per-request cProfile ----------------------------------------------------
+
+class RequestProfile:
+    def __init__(self, label: str):
+        safe_label = re.sub(r'[^0-9A-Za-z_.-]+', '_', label).strip('_') or 'request'
+        self.name = f'{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}-{threading.get_ident()}-{safe_label}.prof'
+        self.profiler = cProfile.Profile()
+        self._finished = False
+
+    def finish(self):
+        """Stop tracing, write the .prof file and release the profiler. Idempotent."""
+        global _profiled_thread
+        if self._finished:
+            return
+        self._finished = True
+        _profiled_thread = None
+        try:
+            self.profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            self.profiler.dump_stats(os.path.join(PROFILE_DIR, self.name))
+        finally:
+            _request_lock.release()
+
+
+def start_request_profile(label: str):
+    """Begin tracing the calling thread, or return None if another request is being profiled."""
+    global _profiled_thread
+    if not _request_lock.acquire(blocking=False):
+        return None
+    profile = RequestProfile(label)
+    try:
+        profile.profiler.enable()
+    except Exception:
+        _request_lock.release()
+        raise
+    _profiled_thread = threading.get_ident()
+    return profile
+
+
+def is_profiling() -> bool:
+    """
+    True if the calling thread's request is being traced. cProfile only sees
+    the thread it was enabled on, so work normally handed to a thread pool
+    should run inline while this is set.
+    """
+    return _profiled_thread == threading.get_ident()
+
+
+def profile_path(name: str):
+    """Path of a dumped request profile, or None if ``name`` isn't one."""
+    if os.path.basename(name) != name or not name.endswith('.prof'):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.exists(path) else None
+
+
+def profile_summary(path: str, sort: str = 'cumulative', limit: int = 40) -> str:
+    stream = io.StringIO()
+    pstats.Stats(path, stream=stream).sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+# -- CLI -----------------------------------------------------------------------
+
+def _fetch_remote(url, seconds, interval, token):
+    import urllib.parse
+    import urllib.request
+
+    query = urllib.parse.urlencode({'seconds': seconds, 'interval_ms': interval * 1000})
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/api/admin/profile?{query}", headers={'X-Profile-Token': token or ''}
+    )
+    with urllib.request.urlopen(request, timeout=seconds + 30) as response:
+        return response.read().decode('utf-8'), response.headers.get('X-Profile-Pid')
+
+
+def _run_local(script_argv, seconds, interval):
+    result = {}
+    stop = threading.Event()
+
+    def sampler():
+        result['counts'], result['ticks'] = sample(seconds, interval, stop)
+
+    thread = threading.Thread(target=sampler, name='sampling-profiler', daemon=True)
+    thread.start()
+    sys.argv = list(script_argv)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script_argv[0])))
+    try:
+        runpy.run_path(script_argv[0], run_name='__main__')
+    finally:
+        stop.set()
+        thread.join()
+    return format_folded(result['counts'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Capture a sampling profile as folded stacks for a flamegraph.")
+    parser.add_argument('--url', help='Profile a running server (e.g. http://localhost:5000)')
+    parser.add_argument('--run', nargs=argparse.REMAINDER, help='Profile a script in-process: --run script.py [args...]')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--interval-ms', type=float, default=DEFAULT_INTERVAL * 1000)
+    parser.add_argument('--token', default=PROFILING_TOKEN, help='Defaults to $PROFILING_TOKEN')
+    parser.add_argument('--output', default='profile.folded')
+    args = parser.parse_args()
+    if bool(args.url) == bool(args.run):
+        parser.error('give exactly one of --url or --run')
+
+    interval = args.interval_ms / 1000
+    if args.url:
+        print(f"🔄 Sampling {args.url} for {args.seconds:g}s...")
+        folded, pid = _fetch_remote(args.url, args.seconds, interval, args.token)
+        source = f"worker pid {pid}"
+    else:
+        print(f"🔄 Sampling {args.run[0]} for up to {args.seconds:g}s...")
+        folded = _run_local(args.run, args.seconds, interval)
+        source = args.run[0]
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(folded)
+    print(f"\n💾 {len(folded.splitlines())} distinct stacks from {source} saved to {args.output}")
+    print(f"   flamegraph.pl {args.output} > flamegraph.svg   (or open it in https://www.speedscope.app)")
@@ -5,7 +5,7 @@ Uses improved analysis with:
   • Trained on 15 diverse review datasets (Amazon, Yelp, Twitter, etc.)
   • Domain-specific sentiment corrections for medical/hospital context
   • Negation handling (e.g., "not good" → negative, "not bad" → positive)
-  • Windowed aspect sentiment to reduce cross-clause interference
+  • Clause-level aspect sentiment, batched across reviews to reduce cross-clause interference
   • nlptown for 1-5 star rating inference
     • Preprocessing: grammar fixes, URL/noise stripping, contraction expansion, lowercasing, stopword removal
 Usage: python reanalyze_reviews.py
@@ -13,11 +13,14 @@ Usage: python reanalyze_reviews.py
 import json
 import os
 import argparse
-from nlp_analyzer import analyze_review, set_analysis_mode, get_analysis_mode
+from nlp_analyzer import analyze_reviews, set_analysis_mode, get_analysis_mode
+from change_feed import ChangeFeed
+from review_store import REVIEWS_FILE, load_reviews, save_reviews, reviews_write_lock
 from datetime import datetime
 
-REVIEWS_FILE = 'reviews.json'
 BACKUP_DIR = 'backups'
+# Reviews analyzed together; the aspect model batches clauses across each chunk
+CHUNK_SIZE = 64
 BACKUP_FILE = os.path.join(BACKUP_DIR, f'reviews_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
 
 def reanalyze_all_reviews():
@@ -30,8 +33,7 @@ def reanalyze_all_reviews():
     
     # Load existing reviews
     print(f"📖 Loading reviews from {REVIEWS_FILE}...")
-    with open(REVIEWS_FILE, 'r', encoding='utf-8') as f:
-        reviews = json.load(f)
+    reviews = load_reviews()
     
     print(f"✓ Found {len(reviews)} reviews to analyze")
     
@@ -45,42 +47,67 @@ def reanalyze_all_reviews():
     # Re-analyze each review
     print(f"\n🔄 Starting re-analysis...")
     updated_count = 0
+    aspects_kept = 0
+    updates = {}
     
-    for idx, review in enumerate(reviews, 1):
+    pending = []
+    for review in reviews:
+        if not review.get('review_text', ''):
+            print(f"  ⚠ Skipping review {review['id']}: No review text")
+            continue
+        pending.append(review)
+    
+    for start in range(0, len(pending), CHUNK_SIZE):
+        chunk = pending[start:start + CHUNK_SIZE]
         try:
-            # Show progress
-            if idx % 50 == 0 or idx == len(reviews):
-                print(f"  Progress: {idx}/{len(reviews)} ({(idx/len(reviews)*100):.1f}%)")
-            
-            # Get review text
-            review_text = review.get('review_text', '')
-            if not review_text:
-                print(f"  ⚠ Skipping review {review['id']}: No review text")
-                continue
-            
             # Run analysis
-            analysis = analyze_review(review_text)
-            
-            # Update review with new analysis
-            review['overall_sentiment'] = analysis['sentiment']
-            review['sentiment_score'] = analysis['score']
-            review['star_rating'] = analysis.get('star_rating', 3)
-            review['aspects'] = analysis['aspects']
-            
-            updated_count += 1
-            
+            analyses = analyze_reviews([review['review_text'] for review in chunk])
         except Exception as e:
-            print(f"  ❌ Error analyzing review {review['id']}: {str(e)}")
+            print(f"  ❌ Error analyzing reviews {chunk[0]['id']}-{chunk[-1]['id']}: {str(e)}")
             continue
+        
+        for review, analysis in zip(chunk, analyses):
+            # Update review with new analysis
+            updated = {
+                'overall_sentiment': analysis['sentiment'],
+                'sentiment_score': analysis['score'],
+                'star_rating': analysis.get('star_rating', 3),
+            }
+            # Aspect model failed for this chunk: keep the stored aspects
+            if analysis['aspects'] is None:
+                aspects_kept += 1
+            else:
+                updated['aspects'] = analysis['aspects']
+            if review.get('degraded') or any(review.get(key) != value for key, value in updated.items()):
+                updates[review['id']] = updated
+            updated_count += 1
+        
+        # Show progress
+        done = min(start + CHUNK_SIZE, len(pending))
+        print(f"  Progress: {done}/{len(pending)} ({(done/len(pending)*100):.1f}%)")
     
     # Save updated reviews
     print(f"\n💾 Saving updated reviews to {REVIEWS_FILE}...")
-    with open(REVIEWS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(reviews, f, indent=2, ensure_ascii=False)
+    with reviews_write_lock():
+        # Re-read under the lock so reviews the server created during the run are kept
+        reviews = load_reviews()
+        changed_ids = []
+        for review in reviews:
+            if review['id'] in updates:
+                review.pop('degraded', None)
+                review.update(updates[review['id']])
+                changed_ids.append(review['id'])
+        save_reviews(reviews)
+        # Let connected clients pick up the changed records via the change feed
+        if changed_ids:
+            ChangeFeed().append(changed_ids)
     
     print(f"\n✅ Complete!")
     print(f"  • Total reviews: {len(reviews)}")
     print(f"  • Successfully updated: {updated_count}")
+    print(f"  • Changed analysis: {len(changed_ids)}")
+    if aspects_kept:
+        print(f"  • Aspect analysis failed, previous aspects kept: {aspects_kept}")
     print(f"  • Backup saved as: {BACKUP_FILE}")
     
     # Show some statistics (binary sentiment: positive/negative only)
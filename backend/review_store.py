@@ -0,0 +1,71 @@
+"""
+reviews.json storage shared by the API server and the maintenance scripts.
+
+Writers take ``reviews_write_lock()`` (a thread lock plus an flock on
+reviews.json.lock, so it also excludes other worker processes and scripts),
+re-read the file under it, apply their change and ``save_reviews``, which
+writes a temp file and swaps it in so readers never see a half-written file.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+REVIEWS_FILE = 'reviews.json'
+
+_reviews_thread_lock = threading.Lock()
+
+
+def load_reviews():
+    if os.path.exists(REVIEWS_FILE):
+        with open(REVIEWS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return []
+
+
+def save_reviews(reviews):
+    tmp_path = f'{REVIEWS_FILE}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(reviews, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, REVIEWS_FILE)
+
+
+@contextmanager
+def reviews_write_lock():
+    """Serialize load-modify-save of reviews.json across threads and processes."""
+    with _reviews_thread_lock:
+        with open(REVIEWS_FILE + '.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def try_process_lock(name: str):
+    """
+    Non-blocking flock on ``<REVIEWS_FILE>.<name>.lock``: yields True if this
+    process got it, False if another process holds it. Used for background
+    jobs that only one worker should run at a time.
+    """
+    with open(f'{REVIEWS_FILE}.{name}.lock', 'a') as lock_file:
+        if not fcntl:
+            yield True
+            return
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,298 @@
+"""
+Compact columnar in-memory review table.
+
+Instead of one dict per review the server keeps a handful of numpy columns:
+  • hospitals are interned into a dimension table and referenced by int32 code
+  • overall sentiment is an int8 enum, star rating int8 (0 = none)
+  • sentiment_score is float32, timestamp is int64 epoch microseconds
+  • aspects are a fixed-width (n, MAX_ASPECTS) pair of int16 aspect codes and
+    int8 polarities, padded with -1
+  • the ``degraded`` flag (analysis produced under load shedding) is a bool
+Only review_text stays a Python list. Filters and aggregates run as
+vectorized masks / bincounts over the columns; reviews are turned back into
+the JSON shape of reviews.json only for the rows an endpoint returns.
+reviews.json itself is still read and written as a list of dicts.
+"""
+import threading
+import numpy as np
+from trends import format_epoch_us, parse_timestamp_us
+
+SENTIMENTS = ('negative', 'positive', 'mixed')
+_SENTIMENT_CODES = {name: code for code, name in enumerate(SENTIMENTS)}
+ASPECT_POLARITIES = ('negative', 'positive')
+_POLARITY_CODES = {name: code for code, name in enumerate(ASPECT_POLARITIES)}
+MAX_ASPECTS = 4
+_UNKNOWN = -1
+
+
+class ReviewTable:
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.RLock()
+        self._n = 0
+        self._capacity = 0
+        # Hospital dimension: code -> (hospital_id, name, address)
+        self.hospitals = []
+        self._hospital_codes = {}
+        # Aspect vocabulary: code -> label
+        self.aspect_labels = []
+        self._aspect_codes = {}
+        self._row_of = {}  # review id -> row
+        self.review_text = []
+        self._alloc(capacity)
+
+    @classmethod
+    def from_records(cls, reviews):
+        table = cls(capacity=max(1024, len(reviews)))
+        for review in reviews:
+            table.upsert(review)
+        return table
+
+    def __len__(self):
+        return self._n
+
+    def _alloc(self, capacity):
+        def grow(name, dtype, shape=(), fill=_UNKNOWN):
+            fresh = np.full((capacity,) + shape, fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                fresh[:self._n] = old[:self._n]
+            setattr(self, name, fresh)
+
+        grow('id', np.int64)
+        grow('hospital', np.int32)
+        grow('timestamp', np.int64)
+        grow('sentiment', np.int8)
+        grow('score', np.float32)
+        grow('star', np.int8)
+        grow('aspect', np.int16, (MAX_ASPECTS,))
+        grow('aspect_sentiment', np.int8, (MAX_ASPECTS,))
+        grow('degraded', np.bool_, fill=False)
+        self._capacity = capacity
+
+    def _intern_hospital(self, review):
+        key = (review.get('hospital_id') or '', review.get('hospital_name') or '', review.get('hospital_address') or '')
+        code = self._hospital_codes.get(key)
+        if code is None:
+            code = self._hospital_codes[key] = len(self.hospitals)
+            self.hospitals.append(key)
+        return code
+
+    def _intern_aspect(self, label):
+        code = self._aspect_codes.get(label)
+        if code is None:
+            code = self._aspect_codes[label] = len(self.aspect_labels)
+            self.aspect_labels.append(label)
+        return code
+
+    def upsert(self, review):
+        """Insert a review, or overwrite the row of an existing review id."""
+        with self._lock:
+            row = self._row_of.get(review['id'])
+            if row is None:
+                if self._n == self._capacity:
+                    self._alloc(self._capacity * 2)
+                row = self._n
+                self._n += 1
+                self._row_of[review['id']] = row
+                self.review_text.append('')
+
+            self.id[row] = review['id']
+            self.hospital[row] = self._intern_hospital(review)
+            epoch = parse_timestamp_us(review.get('timestamp'))
+            self.timestamp[row] = epoch if epoch is not None else _UNKNOWN
+            self.sentiment[row] = _SENTIMENT_CODES.get(review.get('overall_sentiment'), _UNKNOWN)
+            self.score[row] = float(review.get('sentiment_score') or 0)
+            star = review.get('star_rating')
+            self.star[row] = int(star) if star else 0
+            self.aspect[row] = _UNKNOWN
+            self.aspect_sentiment[row] = _UNKNOWN
+            for slot, item in enumerate((review.get('aspects') or [])[:MAX_ASPECTS]):
+                self.aspect[row, slot] = self._intern_aspect(item.get('aspect'))
+                self.aspect_sentiment[row, slot] = _POLARITY_CODES.get(item.get('sentiment'), _UNKNOWN)
+            self.degraded[row] = bool(review.get('degraded'))
+            self.review_text[row] = review.get('review_text', '')
+
+    # -- serialization at the API boundary ---------------------------------
+
+    def record(self, row):
+        hospital_id, name, address = self.hospitals[self.hospital[row]]
+        sentiment = int(self.sentiment[row])
+        star = int(self.star[row])
+        epoch = int(self.timestamp[row])
+        aspects = []
+        for slot in range(MAX_ASPECTS):
+            code = int(self.aspect[row, slot])
+            if code == _UNKNOWN:
+                break
+            polarity = int(self.aspect_sentiment[row, slot])
+            aspects.append({
+                'aspect': self.aspect_labels[code],
+                'sentiment': ASPECT_POLARITIES[polarity] if polarity != _UNKNOWN else None,
+            })
+        record = {
+            'id': int(self.id[row]),
+            'hospital_id': hospital_id,
+            'hospital_name': name,
+            'hospital_address': address,
+            'review_text': self.review_text[row],
+            'timestamp': format_epoch_us(epoch) if epoch != _UNKNOWN else None,
+            'overall_sentiment': SENTIMENTS[sentiment] if sentiment != _UNKNOWN else None,
+            'sentiment_score': round(float(self.score[row]), 4),
+            'star_rating': star or None,
+            'aspects': aspects,
+        }
+        if self.degraded[row]:
+            record['degraded'] = True
+        return record
+
+    def records(self, rows=None):
+        with self._lock:
+            if rows is None:
+                rows = range(self._n)
+            return [self.record(int(row)) for row in rows]
+
+    def records_by_id(self, review_ids):
+        with self._lock:
+            rows = [self._row_of[i] for i in review_ids if i in self._row_of]
+            return [self.record(row) for row in rows]
+
+    # -- vectorized queries ------------------------------------------------
+
+    def _hospital_mask(self, predicate):
+        """Boolean mask over hospital codes, expanded to rows."""
+        matching = np.fromiter(
+            (predicate(hospital) for hospital in self.hospitals), dtype=bool, count=len(self.hospitals)
+        )
+        if not len(matching):
+            return np.zeros(self._n, dtype=bool)
+        return matching[self.hospital[:self._n]]
+
+    def filter(self, hospital_id=None, hospital_name=None, name_query=None, sentiment=None,
+               start=None, end=None, aspect=None, aspect_sentiment=None):
+        """
+        Row indices matching every given condition, newest first.
+
+        name_query is a case-insensitive substring match on hospital name;
+        start/end bound the timestamp as [start, end) and accept ISO strings.
+        """
+        with self._lock:
+            n = self._n
+            mask = np.ones(n, dtype=bool)
+            if hospital_id is not None:
+                mask &= self._hospital_mask(lambda h: h[0] == hospital_id)
+            if hospital_name is not None:
+                mask &= self._hospital_mask(lambda h: h[1] == hospital_name)
+            if name_query:
+                needle = name_query.lower()
+                mask &= self._hospital_mask(lambda h: needle in h[1].lower())
+            if sentiment is not None:
+                mask &= self.sentiment[:n] == _SENTIMENT_CODES.get(sentiment, -2)
+            start_epoch = parse_timestamp_us(start)
+            if start_epoch is not None:
+                mask &= self.timestamp[:n] >= start_epoch
+            end_epoch = parse_timestamp_us(end)
+            if end_epoch is not None:
+                mask &= self.timestamp[:n] < end_epoch
+            if aspect is not None:
+                code = self._aspect_codes.get(aspect, -2)
+                slots = self.aspect[:n] == code
+                if aspect_sentiment is not None:
+                    slots &= self.aspect_sentiment[:n] == _POLARITY_CODES.get(aspect_sentiment, -2)
+                mask &= slots.any(axis=1)
+            rows = np.flatnonzero(mask)
+            # Stable sort keeps insertion order for reviews with equal timestamps
+            order = np.argsort(-self.timestamp[rows], kind='stable')
+            return rows[order]
+
+    def degraded_ids(self):
+        """Ids of reviews whose stored analysis was degraded, oldest first."""
+        with self._lock:
+            return self.id[:self._n][self.degraded[:self._n]].tolist()
+
+    def sentiment_counts(self, rows=None):
+        with self._lock:
+            values = self.sentiment[:self._n] if rows is None else self.sentiment[rows]
+            counts = np.bincount(values[values >= 0], minlength=len(SENTIMENTS))
+            return {name: int(counts[code]) for code, name in enumerate(SENTIMENTS)}
+
+    def hospital_review_counts(self) -> dict:
+        """{hospital_id: number of reviews}"""
+        with self._lock:
+            per_code = np.bincount(self.hospital[:self._n], minlength=len(self.hospitals))
+            counts = {}
+            for (hospital_id, _, _), count in zip(self.hospitals, per_code.tolist()):
+                counts[hospital_id] = counts.get(hospital_id, 0) + count
+            return counts
+
+    def hospital_stats(self, rows=None, top_aspects: int = 5):
+        """
+        Per-hospital aggregates (same fields as the dashboard's hospital stats,
+        minus the review list), grouped by hospital name, busiest first.
+        """
+        with self._lock:
+            if rows is None:
+                rows = np.arange(self._n)
+            if not len(rows):
+                return []
+            names = sorted({h[1] for h in self.hospitals})
+            name_index = {name: i for i, name in enumerate(names)}
+            # Map hospital code -> name group, then group rows by that
+            code_to_group = np.array([name_index[h[1]] for h in self.hospitals], dtype=np.int32)
+            group = code_to_group[self.hospital[rows]]
+            n_groups = len(names)
+
+            totals = np.bincount(group, minlength=n_groups)
+            score_sums = np.bincount(group, weights=self.score[rows].astype(np.float64), minlength=n_groups)
+            sentiment = self.sentiment[rows]
+            per_sentiment = {
+                name: np.bincount(group[sentiment == code], minlength=n_groups)
+                for code, name in enumerate(SENTIMENTS)
+            }
+            # Dashboard convention: positive = 5 stars, negative = 1, anything else = 3
+            derived_stars = np.where(sentiment == _SENTIMENT_CODES['positive'], 5,
+                                     np.where(sentiment == _SENTIMENT_CODES['negative'], 1, 3))
+            star_sums = np.bincount(group, weights=derived_stars, minlength=n_groups)
+
+            # Aspect counts as a (groups x aspects x polarity) histogram
+            n_aspects = max(1, len(self.aspect_labels))
+            aspect_codes = self.aspect[rows]
+            aspect_pol = self.aspect_sentiment[rows]
+            present = aspect_codes >= 0
+            flat_group = np.repeat(group, MAX_ASPECTS).reshape(-1, MAX_ASPECTS)[present]
+            flat_aspect = aspect_codes[present].astype(np.int64)
+            flat_positive = (aspect_pol[present] == _POLARITY_CODES['positive']).astype(np.int64)
+            cells = (flat_group.astype(np.int64) * n_aspects + flat_aspect) * 2 + flat_positive
+            aspect_hist = np.bincount(cells, minlength=n_groups * n_aspects * 2).reshape(n_groups, n_aspects, 2)
+
+            first_row = {}
+            for row, g in zip(rows.tolist(), group.tolist()):
+                first_row.setdefault(g, row)
+
+            stats = []
+            for g in np.flatnonzero(totals).tolist():
+                total = int(totals[g])
+                hospital_id, name, address = self.hospitals[self.hospital[first_row[g]]]
+                common = []
+                for code in np.flatnonzero(aspect_hist[g].sum(axis=1)).tolist():
+                    neg, pos = (int(v) for v in aspect_hist[g, code])
+                    common.append({
+                        'aspect': self.aspect_labels[code],
+                        'count': pos + neg,
+                        'average_sentiment': 'positive' if pos >= neg else 'negative',
+                        'positive_count': pos,
+                        'negative_count': neg,
+                        'total_mentions': pos + neg,
+                    })
+                common.sort(key=lambda item: item['count'], reverse=True)
+                stats.append({
+                    'hospital_id': hospital_id,
+                    'hospital_name': name,
+                    'hospital_address': address,
+                    'total_reviews': total,
+                    'average_score': float(score_sums[g] / total),
+                    'average_star_rating': float(star_sums[g] / total),
+                    'sentiment_breakdown': {s: int(per_sentiment[s][g]) for s in SENTIMENTS},
+                    'common_aspects': common[:top_aspects],
+                })
+            stats.sort(key=lambda item: item['total_reviews'], reverse=True)
+            return stats
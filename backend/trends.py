@@ -0,0 +1,212 @@
+"""
+Time-bucketed sentiment rollups per hospital.
+
+For every hospital and granularity (hour/day/week) we keep a sorted list of
+bucket start times plus a dict of running counters, so a range query is a
+bisect plus a walk over the buckets in range instead of a scan over every
+review. Rollups are updated incrementally as reviews are added or
+re-analyzed: each review's previous contribution is remembered and
+subtracted before the new one is added.
+"""
+import bisect
+import threading
+from datetime import datetime, timedelta, timezone
+
+GRANULARITIES = {
+    'hour': 3600,
+    'day': 86400,
+    'week': 7 * 86400,
+}
+
+# 1970-01-01 was a Thursday; shift weekly buckets so they start on Monday.
+_WEEK_OFFSET = 3 * 86400
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _parse_datetime(value):
+    text = str(value).strip()
+    if not text:
+        return None
+    if text.isdigit():
+        # Query strings carry epoch seconds as text
+        return datetime.fromtimestamp(int(text), tz=timezone.utc)
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def parse_timestamp(value) -> int:
+    """ISO-8601 string (optionally 'Z'-suffixed) or epoch number -> epoch seconds (UTC)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    parsed = _parse_datetime(value)
+    return int(parsed.timestamp()) if parsed else None
+
+
+def parse_timestamp_us(value) -> int:
+    """Like parse_timestamp, but exact epoch microseconds (numbers are taken as seconds)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value * 1_000_000)
+    parsed = _parse_datetime(value)
+    if parsed is None:
+        return None
+    delta = parsed - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def bucket_start(epoch: int, granularity: str) -> int:
+    width = GRANULARITIES[granularity]
+    if granularity == 'week':
+        return (epoch + _WEEK_OFFSET) // width * width - _WEEK_OFFSET
+    return epoch // width * width
+
+
+def format_epoch(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def format_epoch_us(epoch_us: int) -> str:
+    """Inverse of parse_timestamp_us, in the 'Z'-suffixed form the API writes."""
+    value = _EPOCH + timedelta(microseconds=epoch_us)
+    if value.microsecond:
+        return value.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _new_bucket():
+    return {
+        'count': 0,
+        'positive': 0,
+        'negative': 0,
+        'score_sum': 0.0,
+        'star_sum': 0,
+        'star_count': 0,
+        'aspects': {},
+    }
+
+
+def _contribution(review):
+    """The part of a review that feeds the rollups, or None if it can't be bucketed."""
+    epoch = parse_timestamp(review.get('timestamp'))
+    hospital_id = review.get('hospital_id')
+    if epoch is None or not hospital_id:
+        return None
+    return {
+        'hospital_id': hospital_id,
+        'epoch': epoch,
+        'sentiment': review.get('overall_sentiment'),
+        'score': float(review.get('sentiment_score') or 0),
+        'star': review.get('star_rating'),
+        'aspects': [(a.get('aspect'), a.get('sentiment')) for a in review.get('aspects') or []],
+    }
+
+
+class TrendRollups:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}   # (hospital_id, granularity) -> {'keys': [...], 'buckets': {start: bucket}}
+        self._applied = {}  # review id -> contribution currently counted
+        self.seq = None     # change-feed cursor the rollups reflect
+
+    def _bump(self, contrib, sign):
+        for granularity in GRANULARITIES:
+            series = self._series.setdefault((contrib['hospital_id'], granularity), {'keys': [], 'buckets': {}})
+            start = bucket_start(contrib['epoch'], granularity)
+            bucket = series['buckets'].get(start)
+            if bucket is None:
+                bucket = series['buckets'][start] = _new_bucket()
+                bisect.insort(series['keys'], start)
+            bucket['count'] += sign
+            if contrib['sentiment'] in ('positive', 'negative'):
+                bucket[contrib['sentiment']] += sign
+            bucket['score_sum'] += sign * contrib['score']
+            if contrib['star'] is not None:
+                bucket['star_sum'] += sign * contrib['star']
+                bucket['star_count'] += sign
+            for aspect, sentiment in contrib['aspects']:
+                if not aspect or sentiment not in ('positive', 'negative'):
+                    continue
+                counts = bucket['aspects'].setdefault(aspect, {'positive': 0, 'negative': 0})
+                counts[sentiment] += sign
+            if bucket['count'] <= 0:
+                del series['buckets'][start]
+                series['keys'].pop(bisect.bisect_left(series['keys'], start))
+
+    def apply(self, review, seq: int = None):
+        """Add a new review or replace the counted version of an existing one."""
+        contrib = _contribution(review)
+        with self._lock:
+            previous = self._applied.pop(review.get('id'), None)
+            if previous is not None:
+                self._bump(previous, -1)
+            if contrib is not None:
+                self._bump(contrib, 1)
+                self._applied[review.get('id')] = contrib
+            if seq is not None:
+                self.seq = seq
+
+    def rebuild(self, reviews, seq: int = None):
+        with self._lock:
+            self._series = {}
+            self._applied = {}
+            for review in reviews:
+                contrib = _contribution(review)
+                if contrib is None:
+                    continue
+                self._bump(contrib, 1)
+                self._applied[review.get('id')] = contrib
+            self.seq = seq
+
+    def query(self, hospital_id: str, granularity: str = 'day', start=None, end=None, aspect: str = None):
+        """
+        Buckets for one hospital whose start lies in [start, end).
+
+        ``start``/``end`` accept ISO strings or epoch seconds (numbers or
+        digit strings); either may be omitted. Returns the buckets oldest
+        first. Raises ValueError for a bound that can't be parsed.
+        """
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        start_epoch = parse_timestamp(start)
+        end_epoch = parse_timestamp(end)
+        for name, value, epoch in (('start', start, start_epoch), ('end', end, end_epoch)):
+            if value is not None and epoch is None:
+                raise ValueError(f'{name} must be an ISO-8601 timestamp or epoch seconds')
+        with self._lock:
+            series = self._series.get((hospital_id, granularity))
+            if not series:
+                return []
+            keys = series['keys']
+            lo = 0 if start_epoch is None else bisect.bisect_left(keys, bucket_start(start_epoch, granularity))
+            hi = len(keys) if end_epoch is None else bisect.bisect_left(keys, end_epoch)
+            selected = [(key, series['buckets'][key]) for key in keys[lo:hi]]
+            return [self._serialize(key, bucket, aspect) for key, bucket in selected]
+
+    def has_hospital(self, hospital_id: str) -> bool:
+        with self._lock:
+            return (hospital_id, 'day') in self._series
+
+    @staticmethod
+    def _serialize(key, bucket, aspect=None):
+        aspects = bucket['aspects']
+        if aspect:
+            aspects = {name: counts for name, counts in aspects.items() if name.lower() == aspect.lower()}
+        return {
+            'start': format_epoch(key),
+            'count': bucket['count'],
+            'positive': bucket['positive'],
+            'negative': bucket['negative'],
+            'avg_score': round(bucket['score_sum'] / bucket['count'], 3) if bucket['count'] else None,
+            'avg_star': round(bucket['star_sum'] / bucket['star_count'], 2) if bucket['star_count'] else None,
+            'aspects': {name: dict(counts) for name, counts in aspects.items()},
+        }
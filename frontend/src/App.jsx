@@ -1,4 +1,4 @@
-import { useState, useEffect, useMemo } from 'react'
+import { useState, useEffect, useMemo, useRef } from 'react'
 import { api } from '@/lib/api'
 import { ReviewCard } from '@/components/ReviewCard'
 import { ReviewDialog } from '@/components/ReviewDialog'
@@ -26,14 +26,22 @@ function App() {
   const [currentPage, setCurrentPage] = useState(1)
   const [itemsPerPage, setItemsPerPage] = useState(10)
 
+  const [reviewSeq, setReviewSeq] = useState(null)
+  const [hospitals, setHospitals] = useState([])
+  // Ids in the hospital directory; a review for an unknown one means a new hospital
+  const knownHospitalIds = useRef(new Set())
+
+  const sortByNewest = (list) => list.sort((a, b) =>
+    new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime()
+  )
+
   const fetchReviews = async () => {
     try {
       setLoading(true)
       setError('')
-      const data = await api.getReviews()
-      setReviews(data.sort((a, b) => 
-        new Date(b.timestamp).getTime() - new Date(a.timestamp).getTime()
-      ))
+      const { reviews: data, seq } = await api.getReviewsSnapshot()
+      setReviews(sortByNewest(data))
+      setReviewSeq(seq)
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Failed to load reviews')
     } finally {
@@ -41,27 +49,47 @@ function App() {
     }
   }
 
+  const fetchHospitals = async () => {
+    try {
+      const data = await api.getHospitals()
+      knownHospitalIds.current = new Set(data.flatMap((h) => [h.hospital_id, ...(h.aliases || [])]))
+      setHospitals(data)
+    } catch (err) {
+      // Keep the current filter list; the next new hospital retries
+    }
+  }
+
+  // Merge changed reviews into the local copy instead of refetching everything
+  const applyReviewChanges = (changed) => {
+    if (!changed || changed.length === 0) return
+    if (changed.some((r) => !knownHospitalIds.current.has(r.hospital_id))) {
+      fetchHospitals()
+    }
+    setReviews((current) => {
+      const byId = new Map(current.map((r) => [r.id, r]))
+      changed.forEach((r) => byId.set(r.id, r))
+      return sortByNewest(Array.from(byId.values()))
+    })
+  }
+
   useEffect(() => {
     fetchReviews()
+    fetchHospitals()
   }, [])
 
+  useEffect(() => {
+    if (reviewSeq === null) return
+    return api.subscribeToReviewChanges(reviewSeq, {
+      onChanges: ({ reviews: changed }) => applyReviewChanges(changed),
+      onReset: fetchReviews,
+    })
+  }, [reviewSeq])
+
+  // Filter options come from the hospital directory, not a scan of every review
   const hospitalNames = useMemo(() => {
-    const names = new Set(reviews.map((r) => r.hospital_name))
+    const names = new Set(hospitals.map((h) => h.name))
     return Array.from(names).sort()
-  }, [reviews])
-
-  const existingHospitals = useMemo(() => {
-    const hospitalMap = new Map()
-    reviews.forEach((r) => {
-      if (!hospitalMap.has(r.hospital_name)) {
-        hospitalMap.set(r.hospital_name, {
-          name: r.hospital_name,
-          address: r.hospital_address || '',
-        })
-      }
-    })
-    return Array.from(hospitalMap.values())
-  }, [reviews])
+  }, [hospitals])
 
   const filteredReviews = useMemo(() => {
     let filtered = reviews
@@ -218,7 +246,7 @@ function App() {
         <div className="flex items-center justify-between mb-6">
           <h2 className="text-xl md:2xl font-bold text-foreground">Recent Reviews</h2>
           <div className="flex gap-2">
-            <ReviewDialog onReviewCreated={fetchReviews} existingHospitals={existingHospitals} />
+            <ReviewDialog onReviewCreated={(review) => applyReviewChanges([review])} />
           </div>
         </div>
 
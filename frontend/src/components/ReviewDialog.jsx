@@ -14,18 +14,40 @@ import { motion, AnimatePresence } from 'framer-motion'
 import { toast } from 'sonner'
 import { cn } from '@/lib/utils'
 
-export function ReviewDialog({ onReviewCreated, existingHospitals }) {
+export function ReviewDialog({ onReviewCreated }) {
   const [open, setOpen] = useState(false)
   const [loading, setLoading] = useState(false)
   const [analyzing, setAnalyzing] = useState(false)
   const [hospitalOpen, setHospitalOpen] = useState(false)
   const [formData, setFormData] = useState({
+    hospital_id: '',
     hospital_name: '',
     hospital_address: '',
     review_text: '',
   })
   const [preview, setPreview] = useState(null)
   const [error, setError] = useState('')
+  const [hospitalSuggestions, setHospitalSuggestions] = useState([])
+
+  // Typeahead against the hospital directory instead of scanning all reviews client-side
+  useEffect(() => {
+    if (!hospitalOpen) return
+
+    let cancelled = false
+    const timeoutId = setTimeout(async () => {
+      try {
+        const suggestions = await api.suggestHospitals(formData.hospital_name)
+        if (!cancelled) setHospitalSuggestions(suggestions)
+      } catch (err) {
+        if (!cancelled) setHospitalSuggestions([])
+      }
+    }, 150)
+
+    return () => {
+      cancelled = true
+      clearTimeout(timeoutId)
+    }
+  }, [formData.hospital_name, hospitalOpen])
 
   useEffect(() => {
     if (!formData.review_text.trim()) {
@@ -65,14 +87,14 @@ export function ReviewDialog({ onReviewCreated, existingHospitals }) {
     setLoading(true)
 
     try {
-      await api.createReview(formData)
+      const created = await api.createReview(formData)
       toast.success('Review submitted successfully!', {
         description: 'Your review has been analyzed and published.',
       })
       setOpen(false)
-      setFormData({ hospital_name: '', hospital_address: '', review_text: '' })
+      setFormData({ hospital_id: '', hospital_name: '', hospital_address: '', review_text: '' })
       setPreview(null)
-      onReviewCreated()
+      onReviewCreated(created)
     } catch (err) {
       setError(err instanceof Error ? err.message : 'Failed to submit review')
       toast.error('Failed to submit review', {
@@ -86,6 +108,7 @@ export function ReviewDialog({ onReviewCreated, existingHospitals }) {
   const handleHospitalSelect = (hospital) => {
     setFormData({
       ...formData,
+      hospital_id: hospital.hospital_id,
       hospital_name: hospital.name,
       hospital_address: hospital.address,
     })
@@ -156,11 +179,11 @@ export function ReviewDialog({ onReviewCreated, existingHospitals }) {
                 </Button>
               </PopoverTrigger>
               <PopoverContent className="w-full p-0" align="start">
-                <Command>
+                <Command shouldFilter={false}>
                   <CommandInput 
                     placeholder="Search or type hospital name..." 
                     value={formData.hospital_name}
-                    onValueChange={(value) => setFormData({ ...formData, hospital_name: value })}
+                    onValueChange={(value) => setFormData({ ...formData, hospital_id: '', hospital_name: value })}
                   />
                   <CommandList>
                     <CommandEmpty>
@@ -169,16 +192,16 @@ export function ReviewDialog({ onReviewCreated, existingHospitals }) {
                       </div>
                     </CommandEmpty>
                     <CommandGroup heading="Existing Hospitals">
-                      {existingHospitals && existingHospitals.map((hospital) => (
+                      {hospitalSuggestions.map((hospital) => (
                         <CommandItem
-                          key={hospital.name}
-                          value={hospital.name}
+                          key={hospital.hospital_id}
+                          value={hospital.hospital_id}
                           onSelect={() => handleHospitalSelect(hospital)}
                         >
                           <Check
                             className={cn(
                               "mr-2",
-                              formData.hospital_name === hospital.name ? "opacity-100" : "opacity-0"
+                              formData.hospital_id === hospital.hospital_id ? "opacity-100" : "opacity-0"
                             )}
                             size={16}
                           />
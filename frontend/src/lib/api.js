@@ -17,6 +17,40 @@ export const api = {
     return response.json()
   },
 
+  /**
+   * Fetch all reviews together with the change-feed cursor they reflect.
+   * Pass `seq` to getReviewChanges / subscribeToReviewChanges afterwards.
+   */
+  async getReviewsSnapshot() {
+    const response = await fetch(`${API_BASE_URL}/api/reviews`)
+    if (!response.ok) {
+      throw new Error(`Failed to fetch reviews: ${response.statusText}`)
+    }
+    const seq = Number(response.headers.get('X-Review-Seq') || 0)
+    return { reviews: await response.json(), seq }
+  },
+
+  async getReviewChanges(since) {
+    const response = await fetch(`${API_BASE_URL}/api/reviews/changes?since=${since}`)
+    if (!response.ok) {
+      throw new Error(`Failed to fetch review changes: ${response.statusText}`)
+    }
+    return response.json()
+  },
+
+  /**
+   * Subscribe to the server-sent change stream.
+   * onChanges({ seq, reviews }) receives upserted reviews; onReset() means the
+   * cursor is no longer valid and the caller should reload the snapshot.
+   * Returns an unsubscribe function.
+   */
+  subscribeToReviewChanges(since, { onChanges, onReset }) {
+    const source = new EventSource(`${API_BASE_URL}/api/reviews/stream?since=${since}`)
+    source.addEventListener('changes', (event) => onChanges(JSON.parse(event.data)))
+    source.addEventListener('reset', () => onReset && onReset())
+    return () => source.close()
+  },
+
   async createReview(data) {
     const response = await fetch(`${API_BASE_URL}/api/reviews`, {
       method: 'POST',
@@ -31,6 +65,35 @@ export const api = {
     return response.json()
   },
 
+  async getHospitals() {
+    const response = await fetch(`${API_BASE_URL}/api/hospitals`)
+    if (!response.ok) {
+      throw new Error(`Failed to fetch hospitals: ${response.statusText}`)
+    }
+    return response.json()
+  },
+
+  async suggestHospitals(prefix, limit = 10) {
+    const params = new URLSearchParams({ prefix, limit: String(limit) })
+    const response = await fetch(`${API_BASE_URL}/api/hospitals/suggest?${params}`)
+    if (!response.ok) {
+      throw new Error(`Failed to fetch hospital suggestions: ${response.statusText}`)
+    }
+    return response.json()
+  },
+
+  async getHospitalTrends(hospitalId, { granularity = 'day', start, end, aspect } = {}) {
+    const params = new URLSearchParams({ granularity })
+    if (start) params.set('start', start)
+    if (end) params.set('end', end)
+    if (aspect) params.set('aspect', aspect)
+    const response = await fetch(`${API_BASE_URL}/api/hospitals/${encodeURIComponent(hospitalId)}/trends?${params}`)
+    if (!response.ok) {
+      throw new Error(`Failed to fetch hospital trends: ${response.statusText}`)
+    }
+    return response.json()
+  },
+
   async analyzeText(text) {
     const response = await fetch(`${API_BASE_URL}/api/analyze`, {
       method: 'POST',